@@ -0,0 +1,175 @@
+import base64
+import json
+from itertools import islice
+from pathlib import PurePath
+
+from django.db import connection, transaction
+from django.db.models import F, Prefetch
+
+from misc.models import TimelineEntry
+from recipes.cache import invalidate_feeds
+from recipes.images import schedule_image_processing
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from recipes.pantry import record_pantry_changes
+from users.models import User
+
+from .serializers import RecipeArchiveSerializer
+
+IMPORT_BATCH_SIZE = 100
+EXPORT_CHUNK_SIZE = 500
+
+
+def parse_ndjson(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield error
+
+
+def batch_references(batch):
+    slugs, names = set(), set()
+    for _, record in batch:
+        if not isinstance(record, dict):
+            continue
+        if isinstance(record.get('tags'), list):
+            slugs.update(slug for slug in record['tags']
+                         if isinstance(slug, str))
+        if isinstance(record.get('ingredients'), list):
+            names.update(item['name'] for item in record['ingredients']
+                         if isinstance(item, dict)
+                         and isinstance(item.get('name'), str))
+    return {
+        'tags': {tag.slug: tag for tag in Tag.objects.filter(slug__in=slugs)},
+        'ingredients': {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in Ingredient.objects.filter(name__in=names)
+        },
+    }
+
+
+def insert_recipes(recipes):
+    if connection.features.can_return_rows_from_bulk_insert:
+        Recipe.objects.bulk_create(recipes)
+        return
+    for recipe in recipes:
+        recipe.save()
+
+
+def import_batch(batch, author):
+    context = batch_references(batch)
+    errors = []
+    valid = []
+    # Исходные записи с base64 освобождаются сразу после валидации
+    batch.reverse()
+    while batch:
+        line, record = batch.pop()
+        if isinstance(record, ValueError):
+            errors.append({'line': line, 'errors': {
+                'non_field_errors': [f'Некорректный JSON: {record}']}})
+            continue
+        serializer = RecipeArchiveSerializer(data=record, context=context)
+        if serializer.is_valid():
+            valid.append(serializer.validated_data)
+        else:
+            errors.append({'line': line, 'errors': serializer.errors})
+    if not valid:
+        return 0, errors
+
+    recipes = [
+        Recipe(author=author, name=data['name'], text=data['text'],
+               cooking_time=data['cooking_time'], image=data['image'])
+        for data in valid
+    ]
+    try:
+        with transaction.atomic():
+            insert_recipes(recipes)
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe_id=recipe.id, tag_id=tag.id)
+                for recipe, data in zip(recipes, valid)
+                for tag in data['tags']
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe_id=recipe.id,
+                                 ingredient_id=item['ingredient'].id,
+                                 amount=item['amount'])
+                for recipe, data in zip(recipes, valid)
+                for item in data['ingredients']
+            )
+            Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ).update_search_vector()
+            User.objects.filter(pk=author.pk).update(
+                recipes_count=F('recipes_count') + len(recipes))
+            TimelineEntry.objects.fan_out(recipes)
+            record_pantry_changes(recipe.id for recipe in recipes)
+            invalidate_feeds([author.pk], {
+                tag.slug for data in valid for tag in data['tags']})
+            for recipe in recipes:
+                schedule_image_processing(recipe.id)
+    finally:
+        for data in valid:
+            data['image'].close()
+    return len(recipes), errors
+
+
+def import_recipes(records, author, batch_size=IMPORT_BATCH_SIZE):
+    report = {'created': 0, 'errors': []}
+    records = enumerate(records, start=1)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return report
+        created, errors = import_batch(batch, author)
+        report['created'] += created
+        report['errors'] += errors
+
+
+def encode_image(image):
+    try:
+        with image.open('rb') as f:
+            content = base64.b64encode(f.read()).decode()
+    except (ValueError, OSError):
+        return None
+    ext = PurePath(image.name).suffix.lstrip('.').lower()
+    return f'data:image/{ext};base64,{content}'
+
+
+def recipe_record(recipe, with_images):
+    record = {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'tags': [recipe_tag.tag.slug
+                 for recipe_tag in recipe.recipetag_set.all()
+                 if recipe_tag.tag],
+        'ingredients': [
+            {'name': item.ingredient.name,
+             'measurement_unit': item.ingredient.measurement_unit,
+             'amount': item.amount}
+            for item in recipe.recipeingredient_set.all() if item.ingredient
+        ],
+    }
+    if with_images:
+        record['image'] = encode_image(recipe.image)
+    return record
+
+
+def export_recipes(queryset, with_images=True):
+    queryset = queryset.order_by('id').prefetch_related(
+        Prefetch('recipetag_set',
+                 queryset=RecipeTag.objects.select_related('tag')),
+        Prefetch('recipeingredient_set',
+                 queryset=RecipeIngredient.objects.select_related(
+                     'ingredient')),
+    )
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:EXPORT_CHUNK_SIZE])
+        if not chunk:
+            return
+        for recipe in chunk:
+            yield recipe_record(recipe, with_images)
+        last_id = chunk[-1].id
@@ -0,0 +1,128 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from recipes.cache import get_catalogue_version, get_feed_versions
+from recipes.models import Ingredient, Tag
+
+
+class CatalogueCacheMixin:
+    def get_catalogue_key(self, request, version):
+        params = sorted(request.query_params.lists())
+        key = f'{request.path}:{params}:{version}'
+        return 'catalogue:' + hashlib.md5(key.encode()).hexdigest()
+
+    def cached_response(self, view, request, *args, **kwargs):
+        version = get_catalogue_version(self.queryset.model)
+        key = self.get_catalogue_key(request, version)
+        etag = quote_etag(key)
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(version))
+        if response is None:
+            data = cache.get(key)
+            if data is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                data = response.data
+                cache.set(key, data, settings.CATALOGUE_CACHE_TIMEOUT)
+            response = Response(data)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class FeedCacheMixin:
+    user_filters = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_feed_dimensions(self, request):
+        if self.action == 'retrieve':
+            return []
+        params = request.query_params
+        names = [f'tag:{slug}' for slug in params.getlist('tags')]
+        if params.get('author'):
+            names.append(f'author:{params["author"]}')
+        return names or ['all']
+
+    def get_feed_key(self, request):
+        params = sorted(request.query_params.lists())
+        versions = get_feed_versions(self.get_feed_dimensions(request))
+        catalogue = (get_catalogue_version(Tag),
+                     get_catalogue_version(Ingredient))
+        key = (f'{request.get_host()}{request.path}:{params}:'
+               f'{catalogue}:{versions}')
+        return 'feed:' + hashlib.md5(key.encode()).hexdigest()
+
+    def get_feed_recipes(self, data):
+        if self.action == 'retrieve':
+            return [data]
+        return data['results']
+
+    def overlay_user_flags(self, user, recipes):
+        favorited = carted = subscribed = set()
+        if not user.is_anonymous:
+            recipe_ids = [recipe['id'] for recipe in recipes]
+            author_ids = [recipe['author']['id'] for recipe in recipes
+                          if recipe['author']]
+            favorited = set(user.favorite.filter(
+                recipe_id__in=recipe_ids).values_list('recipe_id', flat=True))
+            carted = set(user.shopping_cart.filter(
+                recipe_id__in=recipe_ids).values_list('recipe_id', flat=True))
+            subscribed = set(user.follower.filter(
+                author_id__in=author_ids).values_list('author_id', flat=True))
+
+        for recipe in recipes:
+            recipe['is_favorited'] = recipe['id'] in favorited
+            recipe['is_in_shopping_cart'] = recipe['id'] in carted
+            if recipe['author']:
+                recipe['author']['is_subscribed'] = (
+                    recipe['author']['id'] in subscribed)
+
+    def cached_feed_response(self, view, request, *args, **kwargs):
+        if any(request.query_params.get(name) for name in self.user_filters):
+            return view(request, *args, **kwargs)
+
+        key = self.get_feed_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            versions = get_feed_versions(
+                f'recipe:{recipe_id}' for recipe_id in entry['recipes'])
+            if versions == entry['versions']:
+                recipes = self.get_feed_recipes(entry['data'])
+                self.overlay_user_flags(request.user, recipes)
+                return Response(entry['data'])
+
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        recipe_ids = [recipe['id']
+                      for recipe in self.get_feed_recipes(response.data)]
+        cache.set(key, {
+            'data': response.data,
+            'recipes': recipe_ids,
+            'versions': get_feed_versions(
+                f'recipe:{recipe_id}' for recipe_id in recipe_ids),
+        }, settings.FEED_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_feed_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_feed_response(
+            super().retrieve, request, *args, **kwargs)
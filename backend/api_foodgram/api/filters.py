@@ -1,13 +1,29 @@
 import django_filters
+from django import forms
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Value, When)
 from rest_framework import filters
 
-from recipes.models import Recipe
+from misc.models import Favorite, ShoppingCart
+from recipes.models import SEARCH_CONFIG, Recipe, RecipeIngredient, RecipeTag
+
+
+class MultipleValueField(forms.Field):
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [item for item in value or [] if item]
+
+
+class MultipleValueFilter(django_filters.Filter):
+    field_class = MultipleValueField
 
 
 class RecipeFilter(django_filters.FilterSet):
-    tags = django_filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
-    )
+    tags = MultipleValueFilter(method='get_tags')
     is_favorited = django_filters.NumberFilter(
         field_name='is_favorited', method='get_is_favorited'
     )
@@ -15,23 +31,83 @@ class RecipeFilter(django_filters.FilterSet):
         field_name='is_in_shopping_cart', method='get_is_in_shopping_cart'
     )
     author = django_filters.NumberFilter(
-        field_name='author__id'
+        field_name='author_id'
     )
+    search = django_filters.CharFilter(method='get_search')
+
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value
+        )))
+
+    def get_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(value, config=SEARCH_CONFIG,
+                                search_type='websearch')
+            return queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-pub_date', '-id')
+
+        return queryset.filter(
+            Q(name__icontains=value)
+            | Q(text__icontains=value)
+            | Q(Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=value)))
+            | Q(Exists(RecipeTag.objects.filter(
+                recipe=OuterRef('pk'), tag__name__icontains=value)))
+        )
+
+    def filter_by_user(self, queryset, name, model):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        if name in queryset.query.annotations:
+            return queryset.filter(**{name: True})
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )))
 
     def get_is_favorited(self, queryset, name, value):
         if value == 1:
-            return queryset.filter(favorite__user=self.request.user)
+            return self.filter_by_user(queryset, name, Favorite)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value == 1:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return self.filter_by_user(queryset, name, ShoppingCart)
         return queryset
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'is_favorited', 'is_in_shopping_cart', 'author')
+        fields = ('tags', 'is_favorited', 'is_in_shopping_cart', 'author',
+                  'search')
 
 
-class IngredientFilter(filters.SearchFilter):
+class IngredientFilter(filters.BaseFilterBackend):
     search_param = 'name'
+    search_limit = 50
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name or getattr(view, 'action', None) != 'list':
+            return queryset
+
+        if connections[queryset.db].vendor == 'postgresql':
+            queryset = queryset.filter(
+                Q(name__icontains=name) | Q(name__trigram_similar=name)
+            ).annotate(similarity=TrigramSimilarity('name', name))
+        else:
+            queryset = queryset.filter(name__icontains=name).annotate(
+                similarity=Value(0, output_field=IntegerField()))
+
+        queryset = queryset.annotate(is_prefix=Case(
+            When(name__istartswith=name, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+        return queryset.order_by(
+            '-is_prefix', '-similarity', 'name')[:self.search_limit]
@@ -0,0 +1,220 @@
+import base64
+import io
+import json
+import statistics
+import time
+from contextlib import ExitStack
+from itertools import count
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from misc.models import ShoppingCart, Subscription
+from recipes.models import Ingredient, Recipe, Tag
+
+
+def sample_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 240), 'orange').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк основных сценариев API на текущей базе: задержки, '
+            'число запросов к БД и пропускная способность. Данные можно '
+            'подготовить командой generate_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--scenario', action='append', dest='scenarios')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare',
+                            help='Сравнить с результатами из JSON')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый рост p50 при сравнении')
+
+    def scenarios(self):
+        shopper = ShoppingCart.objects.values_list('user', flat=True).first()
+        follower = Subscription.objects.values_list('user', flat=True).first()
+        recipe = Recipe.objects.first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if not (shopper and follower and recipe and tags):
+            raise CommandError('Недостаточно данных, выполните generate_data')
+        tag_query = '&'.join(f'tags={slug}' for slug in tags)
+        pantry = json.dumps({'ingredients': list(
+            Ingredient.objects.values_list('id', flat=True)[:30])})
+        payload = {
+            'name': 'Бенчмарк',
+            'text': 'Рецепт, созданный бенчмарком',
+            'cooking_time': 10,
+            'image': sample_image(),
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [
+                {'id': pk, 'amount': 100}
+                for pk in Ingredient.objects.values_list('id', flat=True)[:5]
+            ],
+        }
+
+        def create(client):
+            response = client.post('/api/recipes/', json.dumps(payload),
+                                   content_type='application/json')
+            self.created.append(response.json()['id'])
+            return response
+
+        amounts = count(1)
+
+        def update(client):
+            ingredients = [dict(item) for item in payload['ingredients']]
+            ingredients[0]['amount'] = next(amounts)
+            return client.patch(f'/api/recipes/{self.created[-1]}/',
+                                json.dumps({'ingredients': ingredients}),
+                                content_type='application/json')
+
+        def delete(client):
+            return client.delete(f'/api/recipes/{self.created.pop()}/')
+
+        return {
+            'recipe-list': (None, lambda client: client.get('/api/recipes/')),
+            'recipe-detail': (None, lambda client: client.get(
+                f'/api/recipes/{recipe.id}/')),
+            'recipe-list-authenticated': (follower, lambda client: client.get(
+                '/api/recipes/')),
+            'recipe-list-tags': (None, lambda client: client.get(
+                f'/api/recipes/?{tag_query}')),
+            'recipe-search': (None, lambda client: client.get(
+                '/api/recipes/?search=суп')),
+            'recipe-pantry': (None, lambda client: client.post(
+                '/api/recipes/pantry/', pantry,
+                content_type='application/json')),
+            'recipe-list-favorited': (shopper, lambda client: client.get(
+                '/api/recipes/?is_favorited=1')),
+            'subscription-feed': (follower, lambda client: client.get(
+                '/api/recipes/feed/')),
+            'subscriptions': (follower, lambda client: client.get(
+                '/api/users/subscriptions/?recipes_limit=3')),
+            'download-shopping-cart': (shopper, lambda client: client.get(
+                '/api/recipes/download_shopping_cart/')),
+            'recipe-create': (shopper, create),
+            'recipe-update': (shopper, update),
+            'recipe-delete': (shopper, delete),
+        }
+
+    def cleanup(self, user_id):
+        client = self.client(user_id)
+        while self.created:
+            client.delete(f'/api/recipes/{self.created.pop()}/')
+
+    def client(self, user_id):
+        if user_id is None:
+            return Client(HTTP_HOST='localhost')
+        token, _ = Token.objects.get_or_create(user_id=user_id)
+        return Client(HTTP_HOST='localhost',
+                      HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def count_rows(self, execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                self.rows_written += max(context['cursor'].rowcount, 0)
+
+    def measure(self, client, request, cold):
+        if cold:
+            cache.clear()
+        self.rows_written = 0
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connection))
+                        for connection in connections.all()]
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(
+                    self.count_rows))
+            started = time.perf_counter()
+            response = request(client)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(f'{response.status_code}: {response.content}')
+        return (elapsed, sum(len(context) for context in contexts),
+                self.rows_written)
+
+    def run(self, client, request, iterations, cold):
+        started = time.perf_counter()
+        samples = [self.measure(client, request, cold)
+                   for _ in range(iterations)]
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency * 1000 for latency, _, _ in samples)
+        return {
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(
+                latencies[min(len(latencies) - 1,
+                              int(len(latencies) * 0.95))], 2),
+            'queries': max(queries for _, queries, _ in samples),
+            'rows_written': max(rows for _, _, rows in samples),
+            'rps': round(iterations / elapsed, 1),
+        }
+
+    def handle(self, *args, **options):
+        self.created = []
+        scenarios = self.scenarios()
+        selected = set(options['scenarios'] or scenarios)
+        unknown = selected - set(scenarios)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(unknown)}')
+        for name in ('recipe-update', 'recipe-delete'):
+            if name in selected and 'recipe-create' not in selected:
+                raise CommandError(f'{name} требует recipe-create')
+        names = [name for name in scenarios if name in selected]
+
+        results = {}
+        self.stdout.write(f'{"scenario":<30}{"p50 ms":>9}{"p95 ms":>9}'
+                          f'{"queries":>9}{"rows":>9}{"rps":>9}')
+        for name in names:
+            user_id, request = scenarios[name]
+            client = self.client(user_id)
+            if name not in ('recipe-create', 'recipe-update',
+                            'recipe-delete'):
+                for _ in range(options['warmup']):
+                    self.measure(client, request, options['cold'])
+            result = self.run(client, request, options['iterations'],
+                              options['cold'])
+            results[name] = result
+            self.stdout.write(
+                f'{name:<30}{result["p50_ms"]:>9}{result["p95_ms"]:>9}'
+                f'{result["queries"]:>9}{result["rows_written"]:>9}'
+                f'{result["rps"]:>9}')
+        self.cleanup(scenarios['recipe-create'][0])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'])
+
+    def compare(self, results, path, threshold):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            if (result['p50_ms'] > before['p50_ms'] * (1 + threshold)
+                    or result['queries'] > before['queries']):
+                regressions.append(
+                    f'{name}: p50 {before["p50_ms"]} -> {result["p50_ms"]} '
+                    f'ms, queries {before["queries"]} -> {result["queries"]}')
+        for line in regressions:
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'Регрессий: {len(regressions)}')
+        self.stdout.write('Регрессий нет')
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+ACTIVITY_SQL = '''
+    SELECT application_name, state, count(*)
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+    GROUP BY application_name, state
+    ORDER BY application_name, state
+'''
+
+
+class Command(BaseCommand):
+    help = ('Показывает настройки и использование соединений с БД '
+            'для подбора числа воркеров под max_connections')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int,
+                            default=settings.IMAGE_PIPELINE_WORKERS + 1)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        config = connection.settings_dict
+        self.stdout.write(f'CONN_MAX_AGE: {config["CONN_MAX_AGE"]}')
+        self.stdout.write('DISABLE_SERVER_SIDE_CURSORS: '
+                          f'{config["DISABLE_SERVER_SIDE_CURSORS"]}')
+        self.stdout.write(f'OPTIONS: {config["OPTIONS"]}')
+        expected = options['workers'] * options['threads']
+        self.stdout.write(f'Ожидаемое число соединений приложения: {expected}')
+
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            max_connections = int(cursor.fetchone()[0])
+            cursor.execute('SHOW superuser_reserved_connections')
+            reserved = int(cursor.fetchone()[0])
+            cursor.execute(ACTIVITY_SQL)
+            activity = cursor.fetchall()
+
+        used = sum(count for _, _, count in activity)
+        self.stdout.write(f'max_connections: {max_connections} '
+                          f'(зарезервировано {reserved})')
+        self.stdout.write(f'Используется: {used}, свободно: '
+                          f'{max_connections - reserved - used}')
+        for application_name, state, count in activity:
+            self.stdout.write(f'  {application_name or "-"} '
+                              f'{state or "-"}: {count}')
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from misc.models import Favorite, ShoppingCart, Subscription
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выводит планы выполнения горячих запросов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true')
+
+    def hot_queries(self, user, recipe, tag_id):
+        return {
+            'favorite exists': Favorite.objects.filter(
+                user=user, recipe=recipe),
+            'shopping cart exists': ShoppingCart.objects.filter(
+                user=user, recipe=recipe),
+            'subscription exists': Subscription.objects.filter(
+                user=user, author_id=recipe.author_id),
+            'followers': Subscription.objects.filter(
+                author_id=recipe.author_id),
+            'recipes by tag': Recipe.objects.filter(
+                recipetag__tag_id=tag_id)[:10],
+            'favorited recipes': Recipe.objects.filter(
+                favorite__user=user)[:10],
+            'recipes in cart': Recipe.objects.filter(
+                shopping_cart__user=user)[:10],
+            'recipe ingredients': RecipeIngredient.objects.filter(
+                recipe=recipe),
+        }
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('?').first()
+        recipe = Recipe.objects.order_by('?').first()
+        tag_id = (RecipeTag.objects.order_by('?')
+                  .values_list('tag_id', flat=True).first())
+        if user is None or recipe is None:
+            raise CommandError('Нет данных: нужны пользователи и рецепты')
+
+        explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_options = {'analyze': True, 'buffers': True}
+
+        for name, queryset in self.hot_queries(user, recipe, tag_id).items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(**explain_options))
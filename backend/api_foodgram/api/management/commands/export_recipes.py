@@ -0,0 +1,31 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api.bulk import export_recipes
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Выгружает рецепты в NDJSON, совместимый с import_recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Файл, по умолчанию stdout')
+        parser.add_argument('--author', help='Email автора рецептов')
+        parser.add_argument('--no-images', action='store_true')
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['author']:
+            queryset = queryset.filter(author__email=options['author'])
+
+        output = (open(options['output'], 'w', encoding='utf-8')
+                  if options['output'] else sys.stdout)
+        try:
+            for record in export_recipes(queryset,
+                                         not options['no_images']):
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,47 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import IMPORT_BATCH_SIZE, import_recipes, parse_ndjson
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Импортирует рецепты из NDJSON или JSON архива. Тэги задаются '
+            'слагами, ингредиенты названием и единицей измерения, '
+            'изображения в формате data:image/<тип>;base64')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--author', required=True,
+                            help='Email автора рецептов')
+        parser.add_argument('--batch-size', type=int,
+                            default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(email=options['author']).first()
+        if author is None:
+            raise CommandError(f'Пользователь {options["author"]} не найден')
+
+        path = Path(options['path'])
+        started = time.monotonic()
+        with open(path, 'rb') as f:
+            if path.suffix == '.json':
+                records = json.load(f)
+                if not isinstance(records, list):
+                    raise CommandError('Ожидается список рецептов')
+            else:
+                records = parse_ndjson(f)
+            report = import_recipes(records, author, options['batch_size'])
+
+        for error in report['errors']:
+            errors = json.dumps(error['errors'], ensure_ascii=False)
+            self.stdout.write(f'Строка {error["line"]}: {errors}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Импортировано рецептов: {report["created"]}, '
+            f'ошибок: {len(report["errors"])}, '
+            f'{report["created"] / max(elapsed, 1e-6):.0f} рецептов/с'
+        )
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2&limit=6',
+    '/api/tags/',
+    '/api/ingredients/?name=мо',
+)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест API: пропускная способность и задержки. '
+            'Запускается против WSGI и ASGI серверов для сравнения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--path', action='append', dest='paths')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--token')
+
+    def fetch(self, url, headers):
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers), timeout=30) as f:
+                f.read()
+                status = f.status
+        except HTTPError as error:
+            status = error.code
+        except URLError:
+            status = None
+        return status, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+
+        self.stdout.write(f'{"path":<40}{"rps":>8}{"p50 ms":>9}'
+                          f'{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+        for path in options['paths'] or DEFAULT_PATHS:
+            url = options['base_url'] + quote(path, safe='/?=&')
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                results = list(executor.map(
+                    lambda _: self.fetch(url, headers),
+                    range(options['requests'])))
+            elapsed = time.perf_counter() - started
+
+            latencies = sorted(latency * 1000 for _, latency in results)
+            errors = sum(status != 200 for status, _ in results)
+            self.stdout.write(
+                f'{path:<40}{len(results) / elapsed:>8.1f}'
+                f'{percentile(latencies, 0.5):>9.1f}'
+                f'{percentile(latencies, 0.95):>9.1f}'
+                f'{percentile(latencies, 0.99):>9.1f}{errors:>8}'
+            )
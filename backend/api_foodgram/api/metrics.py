@@ -0,0 +1,119 @@
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+
+request_stats = ContextVar('request_stats', default=None)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+MAX_RECORDED_QUERIES = 100
+
+
+class RequestStats:
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0
+        self.queries = []
+        self.serializer_time = 0
+        self.serializer_depth = 0
+        self.render_time = 0
+
+    def add_query(self, sql, duration):
+        self.query_count += 1
+        self.query_time += duration
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append((sql, duration))
+
+
+def record_query(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - start)
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        stats = request_stats.get()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        # Засекается только внешний сериализатор, время SQL-запросов,
+        # выполненных внутри него, уже учтено в query_time
+        stats.serializer_depth += 1
+        start, query_time = time.perf_counter(), stats.query_time
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            stats.serializer_time += (time.perf_counter() - start
+                                      - (stats.query_time - query_time))
+
+
+class Series:
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.queries = 0
+        self.db_time = 0
+        self.serializer_time = 0
+        self.render_time = 0
+        self.response_bytes = 0
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = Lock()
+        self.series = defaultdict(Series)
+
+    def observe(self, labels, duration, stats, response_bytes):
+        with self.lock:
+            series = self.series[labels]
+            series.requests += 1
+            series.duration += duration
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    series.buckets[index] += 1
+            series.queries += stats.query_count
+            series.db_time += stats.query_time
+            series.serializer_time += stats.serializer_time
+            series.render_time += stats.render_time
+            series.response_bytes += response_bytes
+
+    def render(self):
+        with self.lock:
+            series = sorted(self.series.items())
+        lines = [
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        for labels, data in series:
+            text = 'view="{}",method="{}",status="{}"'.format(*labels)
+            for bound, count in zip(LATENCY_BUCKETS, data.buckets):
+                lines.append('foodgram_request_duration_seconds_bucket'
+                             f'{{{text},le="{bound}"}} {count}')
+            lines.append('foodgram_request_duration_seconds_bucket'
+                         f'{{{text},le="+Inf"}} {data.requests}')
+            lines.append('foodgram_request_duration_seconds_sum'
+                         f'{{{text}}} {data.duration:.6f}')
+            lines.append('foodgram_request_duration_seconds_count'
+                         f'{{{text}}} {data.requests}')
+        for name, attribute in (
+            ('foodgram_db_queries_total', 'queries'),
+            ('foodgram_db_duration_seconds_total', 'db_time'),
+            ('foodgram_serializer_duration_seconds_total',
+             'serializer_time'),
+            ('foodgram_render_duration_seconds_total', 'render_time'),
+            ('foodgram_response_bytes_total', 'response_bytes'),
+        ):
+            lines.append(f'# TYPE {name} counter')
+            for labels, data in series:
+                text = 'view="{}",method="{}",status="{}"'.format(*labels)
+                lines.append(f'{name}{{{text}}} {getattr(data, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from rest_framework.permissions import SAFE_METHODS
+
+from api_foodgram.database import statement_timeout
+from api_foodgram.db_routers import use_primary
+
+from .metrics import RequestStats, metrics, request_stats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetError(Exception):
+    pass
+
+
+class ContextMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Признак, по которому Django 3.2 вызывает middleware без адаптера
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self.enter(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.exit(state)
+        return self.process_response(request, response, state)
+
+    async def __acall__(self, request):
+        state = self.enter(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.exit(state)
+        return self.process_response(request, response, state)
+
+
+class ReplicaRoutingMiddleware(ContextMiddleware):
+    def is_write(self, request):
+        safe = request.method in SAFE_METHODS
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return not safe
+        actions = getattr(match.func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        if safe:
+            return action in settings.REPLICA_WRITE_ACTIONS
+        return action not in settings.REPLICA_READ_ACTIONS
+
+    def enter(self, request):
+        write = self.is_write(request)
+        return write, use_primary.set(
+            write or settings.REPLICA_STICKY_COOKIE in request.COOKIES
+        )
+
+    def exit(self, state):
+        use_primary.reset(state[1])
+
+    def process_response(self, request, response, state):
+        if state[0] and settings.REPLICA_STICKY_SECONDS:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class StatementTimeoutMiddleware(ContextMiddleware):
+    def enter(self, request):
+        return statement_timeout.set(settings.DB_STATEMENT_TIMEOUT)
+
+    def exit(self, state):
+        statement_timeout.reset(state)
+
+    def process_response(self, request, response, state):
+        return response
+
+
+class InstrumentationMiddleware(ContextMiddleware):
+    def enter(self, request):
+        stats = RequestStats()
+        return stats, request_stats.set(stats), time.perf_counter()
+
+    def exit(self, state):
+        request_stats.reset(state[1])
+
+    def process_response(self, request, response, state):
+        stats, _, start = state
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        size = 0 if response.streaming else len(response.content)
+        metrics.observe(
+            (view, request.method, response.status_code),
+            duration, stats, size
+        )
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={stats.query_time * 1000:.1f};'
+                f'desc="{stats.query_count} queries", '
+                f'serialize;dur={stats.serializer_time * 1000:.1f}, '
+                f'render;dur={stats.render_time * 1000:.1f}, '
+                f'total;dur={duration * 1000:.1f}'
+            )
+        if duration * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning(
+                'Slow request %s %s: %.1f ms, %d queries (%.1f ms), '
+                'serializers %.1f ms\n%s',
+                request.method, request.get_full_path(), duration * 1000,
+                stats.query_count, stats.query_time * 1000,
+                stats.serializer_time * 1000,
+                '\n'.join(f'{sql_time * 1000:.1f} ms: {sql}'
+                          for sql, sql_time in stats.queries)
+            )
+        self.check_query_budget(request, view, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        stats = request_stats.get()
+        start = time.perf_counter()
+
+        def finish(response):
+            stats.render_time = time.perf_counter() - start
+
+        if stats is not None:
+            response.add_post_render_callback(finish)
+        return response
+
+    def check_query_budget(self, request, view, stats):
+        budget = settings.QUERY_BUDGETS.get(view, settings.QUERY_BUDGET)
+        if not budget or stats.query_count <= budget:
+            return
+        message = (f'{request.method} {request.path} ({view}) made '
+                   f'{stats.query_count} queries, budget is {budget}')
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetError(message)
+        logger.warning(message)
@@ -1,6 +1,76 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageWithLimitPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'limit'
+
+
+class RecipePagination(PageWithLimitPagination):
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def encode_cursor(self, recipe):
+        position = f'{recipe.pub_date.isoformat()}|{recipe.id}'
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            position = base64.urlsafe_b64decode(cursor.encode()).decode()
+            pub_date, pk = position.split('|')
+            return datetime.fromisoformat(pub_date), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = request.query_params.get(self.cursor_query_param)
+        if self.cursor is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if self.cursor:
+            pub_date, pk = self.decode_cursor(self.cursor)
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )
+        recipes = list(queryset.order_by('-pub_date', '-id')[:page_size + 1])
+        self.next_recipe = (recipes[page_size - 1]
+                            if len(recipes) > page_size else None)
+        return recipes[:page_size]
+
+    def get_next_link(self):
+        if self.cursor is None:
+            return super().get_next_link()
+        if self.next_recipe is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(self.next_recipe))
+
+    def get_paginated_response(self, data):
+        if self.cursor is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class TimelinePagination(RecipePagination):
+    def paginate_timeline(self, timeline, request):
+        self.request = request
+        self.cursor = request.query_params.get(self.cursor_query_param, '')
+        page_size = self.get_page_size(request)
+        before = self.decode_cursor(self.cursor) if self.cursor else None
+        recipes = timeline(page_size + 1, before)
+        self.next_recipe = (recipes[page_size - 1]
+                            if len(recipes) > page_size else None)
+        return recipes[:page_size]
@@ -0,0 +1,10 @@
+from rest_framework.parsers import BaseParser
+
+from .bulk import parse_ndjson
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return parse_ndjson(stream)
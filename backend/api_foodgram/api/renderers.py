@@ -0,0 +1,57 @@
+import csv
+import json
+
+from rest_framework import renderers
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(renderers.BaseRenderer):
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return '\n'.join(f'{key}: {value}' for key, value in data.items())
+
+    def render_rows(self, rows):
+        raise NotImplementedError
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render_rows(self, rows):
+        for name, measurement_unit, amount in rows:
+            yield f'{name}: {amount} {measurement_unit}\n'
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def render_rows(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for name, measurement_unit, amount in rows:
+            yield writer.writerow((name, measurement_unit, amount))
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False) + '\n'
+
+    def render_rows(self, rows):
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
@@ -1,15 +1,38 @@
 import base64
+import binascii
 import uuid
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import F
 from django.forms.fields import ImageField
+from PIL import Image
 from rest_framework import serializers
 
+from misc.models import ShoppingListItem, TimelineEntry
+from recipes.cache import invalidate_recipe_feed
+from recipes.images import schedule_image_processing
 from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from recipes.pantry import record_pantry_changes
 from users.models import User
 
+from .metrics import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {name: default_storage.url(path)
+                for name, path in value.items()}
+        if request is None:
+            return urls
+        return {name: request.build_absolute_uri(url)
+                for name, url in urls.items()}
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -20,7 +43,10 @@ class UserSerializer(serializers.ModelSerializer):
                   'first_name',
                   'last_name',
                   'password',
-                  'is_subscribed')
+                  'is_subscribed',
+                  'recipes_count',
+                  'followers_count')
+        read_only_fields = ('recipes_count', 'followers_count')
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
@@ -30,16 +56,18 @@ class UserSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return obj.following.filter(user=request.user).exists()
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('__all__')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('__all__')
@@ -75,13 +103,14 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         return value
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     tags = RecipeTagSerializer(source='recipetag_set', many=True)
     ingredients = RecipeIngredientSerializer(
         source='recipeingredient_set', many=True)
 
     image = ImageField()
+    image_variants = ImageVariantsField()
 
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -93,34 +122,65 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'tags',
                   'ingredients',
                   'image',
+                  'image_variants',
                   'is_favorited',
                   'is_in_shopping_cart',
                   'name',
                   'text',
-                  'cooking_time')
+                  'cooking_time',
+                  'favorites_count',
+                  'in_carts_count')
+        read_only_fields = ('favorites_count', 'in_carts_count')
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return request.user.favorite.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return request.user.shopping_cart.filter(recipe=obj).exists()
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     image = ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class PantryRecipeSerializer(ShortRecipeSerializer):
+    matched = serializers.IntegerField()
+    total = serializers.IntegerField()
+    coverage = serializers.FloatField()
 
+    class Meta(ShortRecipeSerializer.Meta):
+        fields = ShortRecipeSerializer.Meta.fields + ('matched', 'total',
+                                                      'coverage')
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=settings.PANTRY_MAX_INGREDIENTS)
+    min_coverage = serializers.FloatField(min_value=0, max_value=1,
+                                          default=0)
+    limit = serializers.IntegerField(min_value=1,
+                                     max_value=settings.PANTRY_MAX_LIMIT,
+                                     default=settings.PANTRY_LIMIT)
+
+
+class SubscriptionSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
     username = serializers.ReadOnlyField(source='author.username')
@@ -130,7 +190,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
     recipes = serializers.SerializerMethodField()
 
-    recipes_count = serializers.ReadOnlyField(source='author.recipe.count')
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = User
@@ -146,26 +206,67 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     def get_recipes(self, obj):
         request = self.context.get('request')
         context = {'request': request}
-        recipes_limit = request.query_params.get('recipes_limit')
-        queryset = Recipe.objects.filter(
-            author=obj.author)[:int(recipes_limit) or None]
-        return ShortRecipeSerializer(queryset, many=True, context=context).data
+        recipes = self.context['recipes'].get(obj.author_id, [])
+        return ShortRecipeSerializer(recipes, many=True, context=context).data
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        return obj.author.following.filter(user=request.user).exists()
+        return obj.user_id == request.user.id
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть передано '
+                          'в формате data:image/<тип>;base64,<данные>.',
+        'too_large': 'Размер изображения не должен превышать '
+                     '{max_bytes} байт.',
+        'too_many_pixels': 'Изображение не должно содержать более '
+                           '{max_pixels} пикселей.',
+    }
+    prefix = 'data:image/'
+    separator = ';base64,'
+    header_max_length = 64
+    chunk_size = 256 * 1024
+
     def to_internal_value(self, data):
-        image_b64 = data
-        file_name = str(uuid.uuid4())
-        format, imgstr = image_b64.split(';base64,')
-        ext = format.split('/')[-1]
-        return ContentFile(base64.b64decode(imgstr),
-                           name=file_name + '.' + ext)
+        if not isinstance(data, str) or not data.startswith(self.prefix):
+            self.fail('invalid_base64')
+        header_end = data.find(self.separator, 0, self.header_max_length)
+        ext = data[len(self.prefix):header_end]
+        if header_end == -1 or not ext.isalnum():
+            self.fail('invalid_base64')
+
+        start = header_end + len(self.separator)
+        max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+        if (len(data) - start) * 3 // 4 > max_bytes:
+            self.fail('too_large', max_bytes=max_bytes)
+
+        image = TemporaryUploadedFile(
+            f'{uuid.uuid4()}.{ext}', f'image/{ext}', 0, None)
+        try:
+            for position in range(start, len(data), self.chunk_size):
+                image.write(base64.b64decode(
+                    data[position:position + self.chunk_size], validate=True))
+        except binascii.Error:
+            image.close()
+            self.fail('invalid_base64')
+        image.size = image.tell()
+        image.seek(0)
+
+        try:
+            width, height = Image.open(image).size
+        except (OSError, Image.DecompressionBombError):
+            image.close()
+            self.fail('invalid_image')
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if width * height > max_pixels:
+            image.close()
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        image.seek(0)
+
+        return super().to_internal_value(image)
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
@@ -194,6 +295,27 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 'Время приготовления должно быть >= 1')
         return value
 
+    def validate_tags(self, value):
+        if len(value) != len(set(value)):
+            raise serializers.ValidationError(
+                'Тэги не должны повторяться')
+        return value
+
+    def validate_ingredients(self, value):
+        ingredient_ids = [ingredient['ingredient_id'] for ingredient in value]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться')
+        return value
+
+    def save(self, **kwargs):
+        image = self.validated_data.get('image')
+        try:
+            return super().save(**kwargs)
+        finally:
+            if image is not None:
+                image.close()
+
     def create_tags(self, recipe, tags):
         objs = [RecipeTag(tag_id=tag.id, recipe_id=recipe.id) for tag in tags]
         RecipeTag.objects.bulk_create(objs)
@@ -203,27 +325,123 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 for ingredient in ingredients])
         RecipeIngredient.objects.bulk_create(objs)
 
+    def update_tags(self, recipe, tags):
+        current = dict(RecipeTag.objects.filter(recipe_id=recipe.id)
+                       .values_list('tag_id', 'tag__slug'))
+        tag_ids = {tag.id for tag in tags}
+        if current.keys() - tag_ids:
+            RecipeTag.objects.filter(recipe_id=recipe.id).exclude(
+                tag_id__in=tag_ids).delete()
+        self.create_tags(recipe, [tag for tag in tags
+                                  if tag.id not in current])
+        return ([slug for slug in current.values() if slug]
+                + [tag.slug for tag in tags])
+
+    def update_ingredients(self, recipe, ingredients):
+        rows = list(RecipeIngredient.objects.filter(recipe_id=recipe.id))
+        current = {item.ingredient_id: item for item in rows
+                   if item.ingredient_id is not None}
+        amounts = {ingredient['ingredient_id']: ingredient['amount']
+                   for ingredient in ingredients}
+        old_amounts = {ingredient_id: item.amount
+                       for ingredient_id, item in current.items()}
+        stale = [item.pk for item in rows if item.ingredient_id not in amounts]
+        if stale:
+            RecipeIngredient.objects.filter(pk__in=stale).delete()
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient_id'] not in current])
+        return old_amounts, amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients = validated_data.pop('recipeingredient_set')
         tags = validated_data.pop('tags')
 
         recipe = Recipe.objects.create(**validated_data, author=author)
+        User.objects.filter(pk=author.pk).update(
+            recipes_count=F('recipes_count') + 1)
 
         self.create_tags(recipe, tags)
         self.create_ingredients(recipe, ingredients)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        TimelineEntry.objects.fan_out([recipe])
+        record_pantry_changes([recipe.id])
+        schedule_image_processing(recipe.id)
+        invalidate_recipe_feed(recipe.id, author.id,
+                               [tag.slug for tag in tags])
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if validated_data.get('tags'):
-            RecipeTag.objects.filter(recipe_id=instance.id).delete()
-            tags = validated_data.pop('tags')
-            self.create_tags(instance, tags)
+            tag_slugs = self.update_tags(instance, validated_data.pop('tags'))
+        else:
+            tag_slugs = list(instance.tags.values_list('slug', flat=True))
+        # Новое название может попасть в любую выдачу, в том числе в поиск
+        invalidate_recipe_feed(instance.id, instance.author_id, tag_slugs)
 
         if validated_data.get('recipeingredient_set'):
-            RecipeIngredient.objects.filter(recipe_id=instance.id).delete()
-            ingredients = validated_data.pop('recipeingredient_set')
-            self.create_ingredients(instance, ingredients)
+            old_amounts, new_amounts = self.update_ingredients(
+                instance, validated_data.pop('recipeingredient_set'))
+            if old_amounts != new_amounts:
+                ShoppingListItem.objects.change_recipe(
+                    instance.id, old_amounts, new_amounts)
+            if old_amounts.keys() != new_amounts.keys():
+                record_pantry_changes([instance.id])
+
+        if 'image' in validated_data:
+            schedule_image_processing(instance.id)
+
+        instance = super().update(instance, validated_data)
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+        return instance
+
+
+class RecipeArchiveIngredientSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    measurement_unit = serializers.CharField(max_length=200)
+    amount = serializers.IntegerField(min_value=1)
+
 
-        return super().update(instance, validated_data)
+class RecipeArchiveSerializer(TimedSerializerMixin, serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    text = serializers.CharField()
+    cooking_time = serializers.IntegerField(min_value=1)
+    image = Base64ImageField()
+    tags = serializers.ListField(child=serializers.SlugField(max_length=150))
+    ingredients = RecipeArchiveIngredientSerializer(many=True)
+
+    def validate_tags(self, value):
+        if len(value) != len(set(value)):
+            raise serializers.ValidationError(
+                'Тэги не должны повторяться')
+        tags = self.context['tags']
+        unknown = [slug for slug in value if slug not in tags]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Неизвестные тэги: {", ".join(unknown)}')
+        return [tags[slug] for slug in value]
+
+    def validate_ingredients(self, value):
+        keys = [(item['name'], item['measurement_unit']) for item in value]
+        if len(keys) != len(set(keys)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться')
+        ingredients = self.context['ingredients']
+        unknown = [f'{name}, {unit}' for name, unit in keys
+                   if (name, unit) not in ingredients]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Неизвестные ингредиенты: {"; ".join(unknown)}')
+        return [{'ingredient': ingredients[key], 'amount': item['amount']}
+                for key, item in zip(keys, value)]
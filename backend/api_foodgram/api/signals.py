@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api_foodgram.database import statement_timeout
+from recipes.cache import (bump_catalogue_version, invalidate_feeds,
+                           invalidate_recipe_feed)
+from recipes.models import Ingredient, Recipe, RecipeTag, Tag
+from recipes.signals import recipes_edited
+
+from .metrics import record_query
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_catalogue(sender, **kwargs):
+    transaction.on_commit(lambda: bump_catalogue_version(sender))
+
+
+@receiver(pre_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    invalidate_recipe_feed(
+        instance.id, instance.author_id,
+        list(instance.tags.values_list('slug', flat=True)))
+
+
+@receiver(recipes_edited)
+def invalidate_edited_recipes(sender, recipe_ids, **kwargs):
+    author_ids = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        'author_id', flat=True)
+    tag_slugs = RecipeTag.objects.filter(recipe_id__in=recipe_ids).values_list(
+        'tag__slug', flat=True)
+    invalidate_feeds(set(author_ids), set(tag_slugs), recipe_ids)
+
+
+@receiver(connection_created)
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def set_statement_timeout(connection, **kwargs):
+    timeout = statement_timeout.get()
+    if connection.vendor != 'postgresql' or not timeout:
+        return
+    with connection.connection.cursor() as cursor:
+        cursor.execute('SET statement_timeout = %s', [timeout])
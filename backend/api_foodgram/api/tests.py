@@ -0,0 +1,677 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.metrics import metrics
+from api.serializers import Base64ImageField
+from misc.models import (Favorite, ShoppingCart, ShoppingListItem,
+                         Subscription, TimelineEntry)
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            RecipeQuerySet, RecipeTag, Tag)
+from recipes.pantry import pantry_index
+from users.models import User
+
+
+def create_user(username, first_name, last_name):
+    return User.objects.create_user(
+        email=f'{username}@example.com', username=username,
+        first_name=first_name, last_name=last_name, password='password')
+
+
+class FoodgramTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author', 'Автор', 'Рецептов')
+        cls.user = create_user('user', 'Пользователь', 'Тестовый')
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeQueryCountTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tags = [
+            Tag.objects.create(name=f'Тэг {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(5)
+        ]
+        cls.recipes = []
+        for i in range(8):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Описание',
+                image='recipes/images/test.png', cooking_time=10)
+            for tag in cls.tags[:i % 3 + 1]:
+                RecipeTag.objects.create(recipe=recipe, tag=tag)
+            for ingredient in cls.ingredients[:i % 5 + 1]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[1])
+        Subscription.objects.create(user=cls.user, author=cls.author)
+
+    def get_with_queries(self, client, url, num):
+        cache.clear()
+        with self.assertNumQueries(num):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_anonymous(self):
+        self.get_with_queries(self.anonymous, '/api/recipes/?limit=2', 4)
+        self.get_with_queries(self.anonymous, '/api/recipes/?limit=8', 4)
+
+    def test_list_authenticated(self):
+        self.get_with_queries(self.client, '/api/recipes/?limit=2', 5)
+        self.get_with_queries(self.client, '/api/recipes/?limit=8', 5)
+
+    def test_detail(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.get_with_queries(self.anonymous, url, 3)
+        self.get_with_queries(self.client, url, 4)
+
+    def test_filtered_list(self):
+        self.get_with_queries(
+            self.anonymous, '/api/recipes/?tags=tag0&tags=tag1', 4)
+        self.get_with_queries(
+            self.anonymous, f'/api/recipes/?author={self.author.id}', 4)
+        response = self.get_with_queries(
+            self.client, '/api/recipes/?is_favorited=1', 5)
+        self.assertEqual(response.data['count'], 1)
+        response = self.get_with_queries(
+            self.client, '/api/recipes/?is_in_shopping_cart=1', 5)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_tags_filter_ignores_empty_values(self):
+        response = self.anonymous.get('/api/recipes/?tags=tag2&tags=')
+        self.assertEqual(response.data['count'], 2)
+        response = self.anonymous.get('/api/recipes/?tags=')
+        self.assertEqual(response.data['count'], len(self.recipes))
+
+    def test_anonymous_user_lists_are_empty(self):
+        response = self.get_with_queries(
+            self.anonymous, '/api/recipes/?is_favorited=1', 0)
+        self.assertEqual(response.data['count'], 0)
+
+
+class SubscriptionTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10)
+
+    def test_subscriptions_without_authors(self):
+        response = self.client.get('/api/users/subscriptions/'
+                                   '?recipes_limit=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+
+    def test_subscribe_backfills_timeline(self):
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, recipe=self.recipe).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_subscribe_to_popular_author(self):
+        User.objects.filter(pk=self.author.pk).update(followers_count=1)
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user).exists())
+        call_command('rebuild_timelines', stdout=io.StringIO())
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [self.recipe.id])
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_data(image=None):
+    buffer = io.BytesIO()
+    (image or Image.new('RGB', (8, 8), 'orange')).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PIPELINE='sync')
+class MediaTestCase(FoodgramTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class RecipeImportTest(MediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Tag.objects.create(name='Завтрак', color='#000000', slug='breakfast')
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+
+    def record(self, **fields):
+        record = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': image_data(),
+            'tags': ['breakfast'],
+            'ingredients': [{'name': 'Соль', 'measurement_unit': 'г',
+                             'amount': 5}],
+        }
+        record.update(fields)
+        return record
+
+    def test_body_must_be_a_list(self):
+        for body in (5, 'рецепт', {'name': 'Рецепт'}):
+            response = self.client.post('/api/recipes/import/', body,
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_invalid_ingredient_name_is_a_record_error(self):
+        records = [
+            self.record(),
+            self.record(ingredients=[{'name': ['Соль'],
+                                      'measurement_unit': 'г',
+                                      'amount': 5}]),
+        ]
+        response = self.client.post('/api/recipes/import/', records,
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']],
+                         [2])
+
+    @override_settings(QUERY_BUDGET=1, QUERY_BUDGET_STRICT=True)
+    def test_import_is_exempt_from_query_budget(self):
+        response = self.client.post('/api/recipes/import/', [self.record()],
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class ShoppingListTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.recipes = []
+        for i in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {i}', text='Описание',
+                image='recipes/images/test.png', cooking_time=10)
+            for ingredient in cls.ingredients[i:i + 2]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+            cls.recipes.append(recipe)
+
+    def assert_consistent(self):
+        self.assertEqual(ShoppingListItem.objects.actual(),
+                         ShoppingListItem.objects.expected())
+
+    def test_shopping_list_follows_cart(self):
+        self.fill_cart()
+        self.assertEqual(
+            ShoppingListItem.objects.get(
+                ingredient=self.ingredients[1]).amount, 20)
+        self.assert_consistent()
+
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/',
+            {'ingredients': [{'id': self.ingredients[1].id, 'amount': 5},
+                             {'id': self.ingredients[2].id, 'amount': 7}]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_consistent()
+
+        self.client.delete(
+            f'/api/recipes/{self.recipes[1].id}/shopping_cart/')
+        self.assert_consistent()
+
+    def fill_cart(self):
+        for recipe in self.recipes:
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+    def admin_client(self):
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', first_name='Админ',
+            last_name='Сайта', password='password')
+        client = Client()
+        client.force_login(admin)
+        return client
+
+    def test_recipe_delete(self):
+        self.fill_cart()
+        response = self.client.delete(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent()
+
+    def test_admin_recipe_delete(self):
+        self.fill_cart()
+        response = self.admin_client().post(
+            f'/admin/recipes/recipe/{self.recipes[0].id}/delete/',
+            {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ShoppingListItem.objects.actual(), {
+            (self.user.id, self.ingredients[1].id): 10,
+            (self.user.id, self.ingredients[2].id): 10,
+        })
+
+    def test_admin_ingredient_row_edit(self):
+        self.fill_cart()
+        row = RecipeIngredient.objects.get(recipe=self.recipes[0],
+                                           ingredient=self.ingredients[0])
+        response = self.admin_client().post(
+            f'/admin/recipes/recipeingredient/{row.id}/change/',
+            {'recipe': self.recipes[0].id,
+             'ingredient': self.ingredients[2].id, 'amount': 3})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ShoppingListItem.objects.get(
+            ingredient=self.ingredients[2]).amount, 13)
+        self.assert_consistent()
+
+    def test_download_falls_back_to_text(self):
+        self.client.post(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        for accept, media_type in (('application/json', 'text/plain'),
+                                   ('text/csv', 'text/csv')):
+            response = self.client.get('/api/recipes/download_shopping_cart/',
+                                       HTTP_ACCEPT=accept)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['Content-Type'].startswith(media_type))
+        for format, media_type in (('pdf', 'text/plain'),
+                                   ('csv', 'text/csv')):
+            response = self.client.get(
+                f'/api/recipes/download_shopping_cart/?format={format}')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['Content-Type'].startswith(media_type))
+
+    def test_apply_to_existing_rows(self):
+        ShoppingListItem.objects.create(
+            user=self.user, ingredient=self.ingredients[0], amount=3)
+        ShoppingListItem.objects.apply(
+            [self.user.id], {self.ingredients[0].id: 2,
+                             self.ingredients[1].id: 4,
+                             self.ingredients[2].id: -1})
+        self.assertEqual(ShoppingListItem.objects.actual(), {
+            (self.user.id, self.ingredients[0].id): 5,
+            (self.user.id, self.ingredients[1].id): 4,
+        })
+
+
+class IngredientSearchTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        Ingredient.objects.create(name='морская соль', measurement_unit='г')
+
+    def test_list_puts_prefix_matches_first(self):
+        response = self.anonymous.get('/api/ingredients/?name=соль')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.data],
+                         ['соль', 'морская соль'])
+
+    def test_retrieve_ignores_search(self):
+        response = self.anonymous.get(
+            f'/api/ingredients/{self.salt.id}/?name=соль')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'соль')
+
+
+class ReplicaRoutingTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10)
+
+    def assert_sticky(self, response, sticky):
+        self.assertLess(response.status_code, 400)
+        self.assertEqual(settings.REPLICA_STICKY_COOKIE in response.cookies,
+                         sticky)
+
+    def test_reads_are_not_pinned(self):
+        for url in ('/api/users/me/', '/api/recipes/',
+                    f'/api/recipes/{self.recipe.id}/',
+                    '/api/recipes/download_shopping_cart/',
+                    '/api/recipes/export/?images=0'):
+            with self.subTest(url=url):
+                self.assert_sticky(self.client.get(url), False)
+        response = self.anonymous.post(
+            '/api/recipes/pantry/', {'ingredients': [self.ingredient.id]},
+            format='json')
+        self.assert_sticky(response, False)
+
+    def test_writes_are_pinned(self):
+        self.assert_sticky(self.client.get(
+            f'/api/recipes/{self.recipe.id}/favorite/'), True)
+        self.assert_sticky(self.client.post(
+            f'/api/users/{self.author.id}/subscribe/'), True)
+
+
+class PantryTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+        cls.recipes = []
+        for i, ingredients in enumerate(((0, 1), (0, 1, 2), (3, ))):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {i}', text='Описание',
+                image='recipes/images/test.png', cooking_time=10)
+            for index in ingredients:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=cls.ingredients[index],
+                    amount=10)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        super().setUp()
+        pantry_index.index = None
+
+    def search(self, indexes, **params):
+        response = self.anonymous.post('/api/recipes/pantry/', {
+            'ingredients': [self.ingredients[i].id for i in indexes],
+            **params,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [(recipe['id'], recipe['matched'], recipe['total'])
+                for recipe in response.data]
+
+    def test_ranking(self):
+        self.assertEqual(self.search([0, 1]), [
+            (self.recipes[0].id, 2, 2),
+            (self.recipes[1].id, 2, 3),
+        ])
+        self.assertEqual(self.search([0, 1, 2, 3], limit=2), [
+            (self.recipes[1].id, 3, 3),
+            (self.recipes[0].id, 2, 2),
+        ])
+
+    def test_min_coverage(self):
+        self.assertEqual(self.search([0, 1], min_coverage=0.8),
+                         [(self.recipes[0].id, 2, 2)])
+        self.assertEqual(self.search([2], min_coverage=0.5), [])
+
+    def test_catch_up_after_recipe_edit(self):
+        self.search([0])
+        index = pantry_index.index
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipes[2].id}/',
+                {'ingredients': [{'id': self.ingredients[0].id,
+                                  'amount': 5}]},
+                format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.search([0, 1]), [
+            (self.recipes[0].id, 2, 2),
+            (self.recipes[2].id, 1, 1),
+            (self.recipes[1].id, 2, 3),
+        ])
+        self.assertIs(pantry_index.index, index)
+        self.assertEqual(set(index.delta), {self.recipes[2].id})
+        self.assertEqual(self.search([3]), [])
+
+
+class FeedCacheTest(MediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tag.objects.create(name='Завтрак', color='#000000',
+                                     slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Каша', text='Описание',
+            image='recipes/images/test.png', cooking_time=10)
+        RecipeTag.objects.create(recipe=cls.recipe, tag=cls.tag)
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', first_name='Админ',
+            last_name='Сайта', password='password')
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+
+    def names(self, url):
+        response = self.anonymous.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_cache_hit(self):
+        self.anonymous.get('/api/recipes/')
+        with self.assertNumQueries(0):
+            response = self.anonymous.get('/api/recipes/')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_user_flags_overlay_cached_page(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.anonymous.get('/api/recipes/')
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/recipes/')
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        response = self.author_client.get('/api/recipes/')
+        self.assertFalse(response.data['results'][0]['is_favorited'])
+        response = self.anonymous.get('/api/recipes/')
+        self.assertFalse(response.data['results'][0]['is_favorited'])
+
+    def test_create_invalidates(self):
+        self.assertEqual(self.names('/api/recipes/?tags=breakfast'), ['Каша'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.author_client.post('/api/recipes/', {
+                'name': 'Омлет', 'text': 'Описание', 'cooking_time': 5,
+                'image': image_data(), 'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names('/api/recipes/?tags=breakfast'),
+                         ['Омлет', 'Каша'])
+
+    def test_update_invalidates_search(self):
+        self.assertEqual(self.names('/api/recipes/?search=Овсянка'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.author_client.patch(
+                f'/api/recipes/{self.recipe.id}/', {'name': 'Овсянка'},
+                format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names('/api/recipes/?search=Овсянка'),
+                         ['Овсянка'])
+
+    def test_delete_invalidates(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(self.anonymous.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.author_client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.anonymous.get(url).status_code, 404)
+
+    def test_admin_edits_invalidate(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        admin = Client()
+        admin.force_login(self.admin)
+        self.assertEqual(self.names('/api/recipes/'), ['Каша'])
+        self.assertEqual(len(self.anonymous.get(url).data['tags']), 1)
+        row = RecipeTag.objects.get(recipe=self.recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = admin.post(
+                f'/admin/recipes/recipetag/{row.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.anonymous.get(url).data['tags'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = admin.post(
+                f'/admin/recipes/recipe/{self.recipe.id}/delete/',
+                {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.anonymous.get(url).status_code, 404)
+        self.assertEqual(self.names('/api/recipes/'), [])
+
+
+class RecipeSearchTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tag.objects.create(name='Завтрак', color='#000000',
+                                     slug='breakfast')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Каша', text='Описание',
+            image='recipes/images/test.png', cooking_time=10)
+        RecipeTag.objects.create(recipe=cls.recipe, tag=cls.tag)
+        Recipe.objects.update_search_vector()
+
+    def search(self, query):
+        response = self.anonymous.get(f'/api/recipes/?search={query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_tag_rename_changes_results(self):
+        self.assertEqual(self.search('Завтрак'), [self.recipe.id])
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        cache.clear()
+        self.assertEqual(self.search('Завтрак'), [])
+        self.assertEqual(self.search('Ужин'), [self.recipe.id])
+
+    def test_vectors_follow_name_changes_only(self):
+        with mock.patch.object(RecipeQuerySet,
+                               'update_search_vector') as update:
+            self.tag.color = '#ffffff'
+            self.tag.save()
+            self.tag.save(update_fields=['color'])
+            update.assert_not_called()
+            self.tag.name = 'Ужин'
+            self.tag.save()
+            update.assert_called_once()
+
+
+class Base64ImageFieldTest(FoodgramTestCase):
+    def post_image(self, image):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'image': image, 'tags': [], 'ingredients': [],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        return [error.code for error in response.data['image']]
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        image = image_data(Image.new('RGB', (40, 40), 'orange'))
+        self.assertEqual(self.post_image(image), ['too_many_pixels'])
+
+    def test_invalid_base64(self):
+        for image in ('картинка', 'data:image/png;base64,!!!!',
+                      image_data()[:-4] + '*'):
+            with self.subTest(image=image[:30]):
+                self.assertEqual(self.post_image(image), ['invalid_base64'])
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=10)
+    def test_too_large(self):
+        self.assertEqual(self.post_image(image_data()), ['too_large'])
+
+    def test_chunked_decode_peak_memory(self):
+        noise = Image.frombytes('RGB', (1000, 1000), os.urandom(3000000))
+        data = image_data(noise)
+        size = len(data) * 3 // 4
+        field = Base64ImageField()
+        # Первый вызов загружает плагины Pillow
+        field.to_internal_value(data).close()
+
+        def peak(decode):
+            tracemalloc.start()
+            try:
+                decode()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        chunked = peak(lambda: field.to_internal_value(data).close())
+        whole = peak(lambda: base64.b64decode(data.split(';base64,')[1]))
+        self.assertGreater(whole, size)
+        self.assertLess(chunked, size // 4)
+
+
+class LoadDataTest(TestCase):
+    def load(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        call_command('load_data', ingredients=path, tags='',
+                     stdout=io.StringIO())
+
+    def test_loads_rows(self):
+        self.load('ingredients.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            ['сахар', 'г'],
+        ]))
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_incomplete_rows(self):
+        for name, content in (
+            ('ingredients.json', json.dumps([
+                {'name': 'соль', 'measurement_unit': 'г'},
+                {'name': 'сахар'},
+            ])),
+            ('ingredients.csv', 'соль,г\nсахар\n'),
+        ):
+            with self.subTest(name=name):
+                with self.assertRaisesMessage(CommandError, 'запись 2'):
+                    self.load(name, content)
+
+
+class InstrumentationTest(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(3):
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Описание',
+                image='recipes/images/test.png', cooking_time=10)
+
+    def test_serializer_time_is_recorded(self):
+        series = metrics.series[('recipes-list', 'GET', 200)]
+        serializer_time = series.serializer_time
+        response = self.anonymous.get('/api/recipes/')
+        self.assertEqual([item.split(';')[0].strip() for item
+                          in response['Server-Timing'].split(',')],
+                         ['db', 'serialize', 'render', 'total'])
+        self.assertGreater(series.serializer_time, serializer_time)
@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import (IngredientViewSet, RecipeViewSet, SubscriptionsViewSet,
-                    TagViewSet, UserViewSet)
+from .async_views import async_view
+from .views import (IngredientViewSet, MetricsView, RecipeViewSet,
+                    SubscriptionsViewSet, TagViewSet, UserViewSet)
 
 router = routers.DefaultRouter()
 router.register('users', UserViewSet, basename='users')
@@ -10,6 +12,16 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 
+ASYNC_ROUTES = {
+    'recipes-list',
+    'recipes-detail',
+    'tags-list',
+    'tags-detail',
+    'ingredients-list',
+    'ingredients-detail',
+    'subscriptions-list',
+}
+
 urlpatterns = [
     path('users/subscriptions/',
          SubscriptionsViewSet.as_view({'get': 'list'}),
@@ -17,4 +29,10 @@ urlpatterns = [
     path('', include('djoser.urls')),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('internal/metrics/', MetricsView.as_view(), name='metrics'),
 ]
+
+if settings.ASYNC_VIEWS:
+    for pattern in urlpatterns[:1] + router.urls:
+        if pattern.name in ASYNC_ROUTES:
+            pattern.callback = async_view(pattern.callback)
@@ -1,28 +1,26 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
-from recipes.models import RecipeIngredient
+from misc.models import ShoppingListItem
+
+EXPORT_CHUNK_SIZE = 2000
 
 
 def download_shopping_cart(self, request):
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__shopping_cart__user=self.request.user
-    )
+    ingredients = ShoppingListItem.objects.filter(user=self.request.user)
 
     ingredients = (ingredients.order_by('ingredient__name')
-                              .values('ingredient__name',
-                                      'ingredient__measurement_unit')
-                              .annotate(amount=Sum('amount'))
+                              .values_list('ingredient__name',
+                                           'ingredient__measurement_unit',
+                                           'amount')
                    )
 
-    export = []
-    for ingredient in ingredients:
-        name = ingredient['ingredient__name']
-        measurement_unit = ingredient['ingredient__measurement_unit']
-        amount = ingredient['amount']
-        export.append(f'{name}: {amount} {measurement_unit}\n')
-
-    response = HttpResponse(export, content_type='text/plain')
-    response['Content-Disposition'] = 'attachment; filename="list.txt"'
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+        renderer.render_rows(ingredients.iterator(EXPORT_CHUNK_SIZE)),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="list.{renderer.format}"'
+    )
 
     return response
@@ -1,18 +1,35 @@
+from collections.abc import Iterator
+
 from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from misc.models import Subscription
-from recipes.models import Ingredient, Recipe, Tag
+from misc.models import ShoppingListItem, Subscription, TimelineEntry
+from recipes.models import Ingredient, Recipe, RecipeNeighbour, Tag
+from recipes.pantry import pantry_index, record_pantry_changes
 
+from .bulk import export_recipes, import_recipes
+from .cache import CatalogueCacheMixin, FeedCacheMixin
 from .filters import IngredientFilter, RecipeFilter
+from .metrics import metrics
+from .negotiation import FallbackContentNegotiation
+from .pagination import RecipePagination, TimelinePagination
+from .parsers import NDJSONParser
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (CSVShoppingCartRenderer, NDJSONRenderer,
+                        TextShoppingCartRenderer)
 from .serializers import (CreateRecipeSerializer, IngredientSerializer,
+                          PantryRecipeSerializer, PantrySerializer,
                           RecipeSerializer, ShortRecipeSerializer,
                           SubscriptionSerializer, TagSerializer,
                           UserSerializer)
@@ -26,22 +43,27 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get', 'post'])
     def subscribe(self, request, pk=None):
-        user = request.user
         author = get_object_or_404(User, id=pk)
-        if (not user.follower.filter(author_id=pk).exists()
-                and user.id != int(pk)):
-            obj = user.follower.create(author_id=pk)
-            obj.save()
-            serializer = UserSerializer(author)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                Subscription.objects.create(user=request.user, author=author)
+                User.objects.filter(pk=author.pk).update(
+                    followers_count=F('followers_count') + 1)
+                TimelineEntry.objects.backfill([request.user.id],
+                                               [author.id])
+        except IntegrityError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        serializer = UserSerializer(author)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def subscribe_delete(self, request, pk=None):
-        user = request.user
-        if user.follower.filter(author_id=pk).exists():
-            obj = user.follower.filter(author_id=pk)
-            obj.delete()
+        deleted, _ = request.user.follower.filter(author_id=pk).delete()
+        if deleted:
+            User.objects.filter(pk=pk).update(
+                followers_count=F('followers_count') - 1)
+            TimelineEntry.objects.unfollow(request.user.id, pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -50,7 +72,25 @@ class SubscriptionsViewSet(viewsets.ModelViewSet):
     serializer_class = SubscriptionSerializer
 
     def get_queryset(self):
-        return Subscription.objects.filter(user=self.request.user)
+        return (Subscription.objects.filter(user=self.request.user)
+                                    .select_related('author')
+                                    .order_by('-id'))
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        recipes_limit = request.query_params.get('recipes_limit', '')
+        recipes_limit = int(recipes_limit) if recipes_limit.isdigit() else 0
+
+        recipes = {}
+        for recipe in Recipe.objects.latest_by_author(
+                [subscription.author_id for subscription in page],
+                recipes_limit or None):
+            recipes.setdefault(recipe.author_id, []).append(recipe)
+
+        context = self.get_serializer_context()
+        context['recipes'] = recipes
+        serializer = self.get_serializer(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
 
 
 class ListRetrieveViewSet(ListAPIView, RetrieveAPIView,
@@ -58,27 +98,36 @@ class ListRetrieveViewSet(ListAPIView, RetrieveAPIView,
     pass
 
 
-class TagViewSet(ListRetrieveViewSet):
+class TagViewSet(CatalogueCacheMixin, ListRetrieveViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [permissions.AllowAny, ]
     pagination_class = None
 
 
-class IngredientViewSet(ListRetrieveViewSet):
+class IngredientViewSet(CatalogueCacheMixin, ListRetrieveViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [permissions.AllowAny, ]
     pagination_class = None
     filter_backends = [IngredientFilter, ]
-    search_fields = ('^name', )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(FeedCacheMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
 
     filter_backends = [filters.DjangoFilterBackend, ]
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+    recipe_counters = {
+        'Favorite': 'favorites_count',
+        'ShoppingCart': 'in_carts_count',
+    }
+
+    def get_queryset(self):
+        if self.action in ['list', 'retrieve']:
+            return Recipe.objects.for_feed(self.request.user)
+        return super().get_queryset()
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -107,34 +156,126 @@ class RecipeViewSet(viewsets.ModelViewSet):
         instance_serializer = RecipeSerializer(instance)
         return Response(instance_serializer.data)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') - 1)
+        record_pantry_changes([instance.id])
+        instance.delete()
+
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'similar', 'pantry']:
             self.permission_classes = [permissions.AllowAny, ]
         if self.action in ['destroy', 'update']:
             self.permission_classes = [IsAuthorOrReadOnly, ]
         return super().get_permissions()
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'],
+            renderer_classes=[TextShoppingCartRenderer,
+                              CSVShoppingCartRenderer],
+            content_negotiation_class=FallbackContentNegotiation)
     def download_shopping_cart(self, request):
         return download_shopping_cart(self, request)
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        recipe = get_object_or_404(Recipe, pk=pk)
+        kinds = dict(RecipeNeighbour.KINDS)
+        kind = request.query_params.get('by', RecipeNeighbour.INGREDIENTS)
+        if kind not in kinds:
+            return Response({'by': f'Допустимые значения: {", ".join(kinds)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        neighbours = (recipe.neighbours.filter(kind=kind)
+                                       .select_related('neighbour')
+                                       .order_by('rank'))
+        serializer = ShortRecipeSerializer(
+            [item.neighbour for item in neighbours], many=True,
+            context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def pantry(self, request):
+        serializer = PantrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        results = pantry_index.get().search(
+            data['ingredients'], data['limit'], data['min_coverage'])
+        recipes = Recipe.objects.defer('search_vector').in_bulk(
+            [recipe_id for recipe_id, _, _ in results])
+        page = []
+        for recipe_id, matched, total in results:
+            if recipe_id not in recipes:
+                continue
+            recipe = recipes[recipe_id]
+            recipe.matched, recipe.total = matched, total
+            recipe.coverage = round(matched / total, 4)
+            page.append(recipe)
+        serializer = PantryRecipeSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            pagination_class=TimelinePagination)
+    def feed(self, request):
+        queryset = Recipe.objects.for_feed(request.user)
+        page = self.paginator.paginate_timeline(
+            lambda limit, before: TimelineEntry.objects.recipes(
+                request.user, queryset, limit, before),
+            request)
+        serializer = RecipeSerializer(page, many=True,
+                                      context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='import',
+            parser_classes=[NDJSONParser, JSONParser])
+    def import_recipes(self, request):
+        records = request.data
+        if not isinstance(records, (list, Iterator)):
+            return Response({'errors': 'Ожидается список рецептов'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        report = import_recipes(records, request.user)
+        if report['created'] or not report['errors']:
+            return Response(report, status=status.HTTP_201_CREATED)
+        return Response(report, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'], url_path='export',
+            renderer_classes=[NDJSONRenderer])
+    def export_recipes(self, request):
+        queryset = self.filter_queryset(Recipe.objects.all())
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.render_rows(export_recipes(
+                queryset, request.query_params.get('images') != '0')),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{renderer.format}"'
+        )
+        return response
+
     def add_recipe(self, model_name, request, pk=None):
         model = apps.get_model('misc', model_name)
-        if not model.objects.filter(user_id=request.user.id,
-                                    recipe_id=pk).exists():
-            obj = model.objects.create(user_id=request.user.id, recipe_id=pk)
-            obj.save()
-            recipe_serializer = ShortRecipeSerializer(self.get_object())
-            return Response(recipe_serializer.data,
-                            status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
+        counter = self.recipe_counters[model_name]
+        recipe = self.get_object()
+        try:
+            with transaction.atomic():
+                model.objects.create(user=request.user, recipe=recipe)
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    **{counter: F(counter) + 1})
+        except IntegrityError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        recipe_serializer = ShortRecipeSerializer(recipe)
+        return Response(recipe_serializer.data,
+                        status=status.HTTP_201_CREATED)
+
+    @transaction.atomic
     def delete_recipe(self, model_name, request, pk=None):
         model = apps.get_model('misc', model_name)
-        if model.objects.filter(user_id=request.user.id,
-                                recipe_id=pk).exists():
-            obj = get_object_or_404(model, user=request.user.id, recipe__id=pk)
-            obj.delete()
+        counter = self.recipe_counters[model_name]
+        deleted, _ = model.objects.filter(user_id=request.user.id,
+                                          recipe_id=pk).delete()
+        if deleted:
+            Recipe.objects.filter(pk=pk).update(**{counter: F(counter) - 1})
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -147,9 +288,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.delete_recipe('Favorite', request, pk)
 
     @action(detail=True, methods=['get', 'post'])
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
-        return self.add_recipe('ShoppingCart', request, pk)
+        response = self.add_recipe('ShoppingCart', request, pk)
+        if response.status_code == status.HTTP_201_CREATED:
+            ShoppingListItem.objects.add_recipe(request.user.id, pk)
+        return response
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def shopping_cart_delete(self, request, pk=None):
-        return self.delete_recipe('ShoppingCart', request, pk)
+        response = self.delete_recipe('ShoppingCart', request, pk)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            ShoppingListItem.objects.remove_recipe(request.user.id, pk)
+        return response
+
+
+class MetricsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(metrics.render(),
+                            content_type='text/plain; version=0.0.4')
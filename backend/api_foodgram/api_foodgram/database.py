@@ -0,0 +1,43 @@
+import os
+from contextvars import ContextVar
+
+# Выставляется StatementTimeoutMiddleware на время обработки запроса
+statement_timeout = ContextVar('statement_timeout', default=0)
+
+
+def database_config(**overrides):
+    engine = os.getenv('DB_ENGINE')
+    pgbouncer = os.getenv('DB_POOL_MODE') == 'pgbouncer'
+    config = {
+        'ENGINE': engine,
+        'NAME': os.environ.get('DB_NAME'),
+        'USER': os.environ.get('POSTGRES_USER'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
+        'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': pgbouncer,
+    }
+    if engine and 'postgresql' in engine:
+        options = {
+            'application_name': os.getenv('DB_APPLICATION_NAME', 'foodgram'),
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        }
+        config['OPTIONS'] = options
+    config.update(overrides)
+    return config
+
+
+def replica_configs():
+    addresses = filter(None, os.getenv('DB_REPLICAS', '').split(','))
+    replicas = {}
+    for index, address in enumerate(addresses):
+        if 'sqlite' in os.getenv('DB_ENGINE', ''):
+            overrides = {'NAME': address.strip()}
+        else:
+            host, _, port = address.strip().partition(':')
+            overrides = {'HOST': host, 'PORT': port or os.getenv('DB_PORT')}
+        replicas[f'replica{index}'] = database_config(
+            TEST={'MIRROR': 'default'}, **overrides
+        )
+    return replicas
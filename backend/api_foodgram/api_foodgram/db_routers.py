@@ -0,0 +1,21 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+use_primary = ContextVar('use_primary', default=True)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (use_primary.get() or not settings.DATABASE_REPLICAS
+                or connections['default'].in_atomic_block):
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
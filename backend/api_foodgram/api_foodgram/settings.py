@@ -1,6 +1,8 @@
 import os
 from pathlib import Path
 
+from .database import database_config, replica_configs
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get('SECRET_KEY')
@@ -17,6 +19,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -28,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.InstrumentationMiddleware',
+    'api.middleware.StatementTimeoutMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -35,6 +40,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'api_foodgram.urls'
@@ -57,18 +63,72 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'api_foodgram.wsgi.application'
 
+ASGI_APPLICATION = 'api_foodgram.asgi.application'
+
+ASYNC_VIEWS = os.getenv('SERVER_MODE', 'wsgi') == 'asgi'
+
 
 DATABASES = {
+    'default': database_config(),
+    **replica_configs(),
+}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api_foodgram.db_routers.ReplicaRouter']
+REPLICA_STICKY_COOKIE = 'use_primary'
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+# GET-действия, которые изменяют данные, и POST-действия, которые только читают
+REPLICA_WRITE_ACTIONS = ('favorite', 'shopping_cart', 'subscribe')
+REPLICA_READ_ACTIONS = ('pantry',)
+
+# Только для соединений, открытых при обработке запроса; в режиме
+# transaction pooling pgbouncer настройки сессии не сохраняются
+DB_STATEMENT_TIMEOUT = (
+    0 if os.getenv('DB_POOL_MODE') == 'pgbouncer'
+    else int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+)
+
+CACHES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE'),
-        'NAME': os.environ.get('DB_NAME'),
-        'USER': os.environ.get('POSTGRES_USER'),
-        'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
-        'HOST': os.environ.get('DB_HOST'),
-        'PORT': os.environ.get('DB_PORT'),
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+CATALOGUE_CACHE_TIMEOUT = int(os.getenv('CATALOGUE_CACHE_TIMEOUT', 600))
+
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', 60))
+FEED_VERSION_TIMEOUT = 24 * 60 * 60
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 100))
+
+RECOMMENDATIONS_LIMIT = 20
+
+PANTRY_LIMIT = 20
+PANTRY_MAX_LIMIT = 100
+PANTRY_MAX_INGREDIENTS = 500
+PANTRY_MAX_DELTA = int(os.getenv('PANTRY_MAX_DELTA', 1000))
+PANTRY_VERSION_TIMEOUT = 24 * 60 * 60
+# Изменения индекса видны другим воркерам только через общий кэш (Redis,
+# memcached), с локальным кэшем индекс просто перестраивается по таймауту
+PANTRY_INDEX_TTL = int(os.getenv(
+    'PANTRY_INDEX_TTL',
+    300 if CACHES['default']['BACKEND'].endswith('LocMemCache') else 0
+))
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'true') == 'true'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 30))
+QUERY_BUDGETS = {
+    # Импорт делает несколько запросов на каждую пачку рецептов
+    'recipes-import-recipes': 0,
+}
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'false') == 'true'
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -103,6 +163,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.getenv('RECIPE_IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 40000000))
+
+IMAGE_PIPELINE = os.getenv('IMAGE_PIPELINE', 'thread')
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+IMAGE_VARIANTS = {
+    'thumbnail': 320,
+    'medium': 960,
+    'full': 1920,
+}
+IMAGE_VARIANT_QUALITY = 80
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
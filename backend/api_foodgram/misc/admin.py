@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Favorite, ShoppingCart, Subscription
+from .models import (Favorite, ShoppingCart, ShoppingListItem, Subscription,
+                     TimelineEntry)
 
 
 class FavoriteAdmin(admin.ModelAdmin):
@@ -10,11 +11,37 @@ class FavoriteAdmin(admin.ModelAdmin):
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
 
+    def save_model(self, request, obj, form, change):
+        user_ids = {obj.user_id}
+        if change:
+            user_ids.add(form.initial['user'])
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.rebuild(user_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild([obj.user_id])
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild(user_ids)
+
 
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'author')
 
 
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'amount')
+
+
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'recipe', 'author', 'pub_date')
+
+
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
+admin.site.register(TimelineEntry, TimelineEntryAdmin)
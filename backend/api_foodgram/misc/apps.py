@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_delete
 
 
 class MiscConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'misc'
+
+    def ready(self):
+        from recipes.models import Recipe
+        from recipes.signals import recipes_edited
+
+        from .signals import rebuild_shopping_lists, remove_deleted_recipe
+
+        pre_delete.connect(remove_deleted_recipe, sender=Recipe)
+        recipes_edited.connect(rebuild_shopping_lists)
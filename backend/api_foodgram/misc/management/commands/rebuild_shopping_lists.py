@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from misc.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Проверяет и пересобирает сводные списки покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='+', dest='user_ids')
+        parser.add_argument('--check', action='store_true')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        expected = ShoppingListItem.objects.expected(user_ids)
+        actual = ShoppingListItem.objects.actual(user_ids)
+        drift = {key for key in expected.keys() | actual.keys()
+                 if expected.get(key) != actual.get(key)}
+
+        for user_id, ingredient_id in sorted(drift):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'{actual.get((user_id, ingredient_id))} != '
+                f'{expected.get((user_id, ingredient_id))}'
+            )
+
+        if options['check']:
+            if drift:
+                raise CommandError(f'Расхождений: {len(drift)}')
+            self.stdout.write('Расхождений нет')
+            return
+
+        with transaction.atomic():
+            ShoppingListItem.objects.rebuild(user_ids)
+        self.stdout.write(f'Пересобрано, исправлено расхождений: {len(drift)}')
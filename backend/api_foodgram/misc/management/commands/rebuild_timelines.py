@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from misc.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает ленты подписок из подписок и последних рецептов '
+            'авторов, рецепты популярных авторов подмешиваются при чтении')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='+', dest='user_ids')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TimelineEntry.objects.rebuild(options['user_ids'])
+        self.stdout.write(
+            f'Записей в лентах: {TimelineEntry.objects.count()}')
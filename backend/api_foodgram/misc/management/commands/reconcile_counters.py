@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from misc.models import Favorite, ShoppingCart, Subscription
+from recipes.models import Recipe
+from users.models import User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def actual_count(model, field):
+    counts = (model.objects.filter(**{field: OuterRef('pk')})
+              .order_by()
+              .values(field)
+              .annotate(total=Count('pk'))
+              .values('total'))
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и исправляет денормализованные счётчики'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true')
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            for owner, counter, model, field in COUNTERS:
+                actual = actual_count(model, field)
+                drift = owner.objects.exclude(**{counter: actual})
+                count = drift.count()
+                total += count
+                self.stdout.write(
+                    f'{owner._meta.label}.{counter}: расхождений {count}')
+                if count and not options['check']:
+                    drift.update(**{counter: actual})
+
+        if options['check'] and total:
+            raise CommandError(f'Расхождений: {total}')
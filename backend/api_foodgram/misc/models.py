@@ -1,6 +1,10 @@
+import heapq
+
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Q, Sum
 
-from recipes.models import Recipe
+from recipes.models import Ingredient, Recipe, RecipeIngredient
 from users.models import User
 
 
@@ -17,6 +21,12 @@ class ShoppingCart(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='Shopping cart unique constraint'
+            ),
+        ]
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзина покупок'
 
@@ -34,10 +44,12 @@ class Favorite(models.Model):
     )
 
     class Meta:
-        models.UniqueConstraint(
-            fields=['user', 'recipe'],
-            name='Favorite unique constraint'
-        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='Favorite unique constraint'
+            ),
+        ]
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
 
@@ -55,9 +67,257 @@ class Subscription(models.Model):
     )
 
     class Meta:
-        models.UniqueConstraint(
-            fields=['user', 'author'],
-            name='Subscription unique constraint'
-        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='Subscription unique constraint'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='Subscription self constraint'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='subscription_author_user_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+
+
+class ShoppingListManager(models.Manager):
+    def recipe_amounts(self, recipe_id):
+        amounts = (RecipeIngredient.objects
+                   .filter(recipe_id=recipe_id, ingredient__isnull=False)
+                   .values('ingredient_id')
+                   .annotate(total=Sum('amount'))
+                   .values_list('ingredient_id', 'total'))
+        return dict(amounts)
+
+    def expected(self, user_ids=None):
+        lookups = {'recipe__shopping_cart__isnull': False}
+        if user_ids is not None:
+            # Один filter(), чтобы не присоединять корзину дважды
+            lookups = {'recipe__shopping_cart__user_id__in': user_ids}
+        ingredients = (RecipeIngredient.objects
+                       .filter(ingredient__isnull=False, **lookups)
+                       .values('recipe__shopping_cart__user_id',
+                               'ingredient_id')
+                       .annotate(total=Sum('amount'))
+                       .values_list('recipe__shopping_cart__user_id',
+                                    'ingredient_id',
+                                    'total'))
+        return {(user_id, ingredient_id): total
+                for user_id, ingredient_id, total in ingredients}
+
+    def actual(self, user_ids=None):
+        items = self.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items = items.values_list('user_id', 'ingredient_id', 'amount')
+        return {(user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in items}
+
+    def apply(self, user_ids, deltas):
+        user_ids = list(user_ids)
+        deltas = {ingredient_id: delta
+                  for ingredient_id, delta in deltas.items() if delta}
+        if not user_ids or not deltas:
+            return
+
+        # Сначала создаются недостающие строки, затем суммы прибавляются
+        # атомарным UPDATE: параллельная вставка той же пары игнорируется
+        self.bulk_create((
+            self.model(user_id=user_id, ingredient_id=ingredient_id, amount=0)
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items() if delta > 0
+        ), ignore_conflicts=True)
+        for ingredient_id, delta in deltas.items():
+            self.filter(user_id__in=user_ids,
+                        ingredient_id=ingredient_id).update(
+                amount=F('amount') + delta)
+        self.filter(user_id__in=user_ids, amount__lte=0).delete()
+
+    def add_recipe(self, user_id, recipe_id):
+        self.apply([user_id], self.recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        amounts = self.recipe_amounts(recipe_id)
+        self.apply([user_id], {ingredient_id: -amount
+                               for ingredient_id, amount in amounts.items()})
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        deltas = {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        user_ids = ShoppingCart.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True)
+        self.apply(user_ids, deltas)
+
+    def rebuild(self, user_ids=None):
+        items = self.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        self.bulk_create(
+            self.model(user_id=user_id, ingredient_id=ingredient_id,
+                       amount=amount)
+            for (user_id, ingredient_id), amount
+            in self.expected(user_ids).items()
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    amount = models.IntegerField()
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='Shopping list unique constraint'
+            ),
+        ]
+        verbose_name = 'Список покупок'
+        verbose_name_plural = 'Списки покупок'
+
+
+class TimelineManager(models.Manager):
+    def popular_authors(self, user):
+        return list(Subscription.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True))
+
+    def fan_out(self, recipes):
+        authors = set(User.objects.filter(
+            pk__in={recipe.author_id for recipe in recipes},
+            followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        ).values_list('id', flat=True))
+        followers = {}
+        for user_id, author_id in Subscription.objects.filter(
+                author_id__in=authors).values_list('user_id', 'author_id'):
+            followers.setdefault(author_id, []).append(user_id)
+        self.bulk_create((
+            self.model(user_id=user_id, recipe_id=recipe.id,
+                       author_id=recipe.author_id, pub_date=recipe.pub_date)
+            for recipe in recipes
+            for user_id in followers.get(recipe.author_id, [])
+        ), batch_size=1000, ignore_conflicts=True)
+
+    def backfill(self, user_ids, author_ids=None):
+        subscriptions = Subscription.objects.filter(
+            user_id__in=user_ids,
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        )
+        if author_ids is not None:
+            subscriptions = subscriptions.filter(author_id__in=author_ids)
+        subscriptions = subscriptions.values_list('user_id', 'author_id')
+        followers = {}
+        for user_id, author_id in subscriptions:
+            followers.setdefault(author_id, []).append(user_id)
+        if not followers:
+            return
+        recipes = Recipe.objects.latest_by_author(
+            list(followers), settings.FEED_BACKFILL)
+        self.bulk_create((
+            self.model(user_id=user_id, recipe_id=recipe.id,
+                       author_id=recipe.author_id, pub_date=recipe.pub_date)
+            for recipe in recipes
+            for user_id in followers[recipe.author_id]
+        ), batch_size=1000, ignore_conflicts=True)
+
+    def unfollow(self, user_id, author_id):
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def rebuild(self, user_ids=None):
+        entries = self.all()
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=user_ids)
+        entries.delete()
+        users = Subscription.objects.order_by('user_id').values_list(
+            'user_id', flat=True).distinct()
+        if user_ids is not None:
+            users = users.filter(user_id__in=user_ids)
+        users = list(users)
+        for start in range(0, len(users), 500):
+            self.backfill(users[start:start + 500])
+
+    def recipe_positions(self, user, limit, before=None):
+        entries = self.filter(user=user)
+        recipes = Recipe.objects.filter(
+            author_id__in=self.popular_authors(user))
+        if before is not None:
+            pub_date, pk = before
+            entries = entries.filter(Q(pub_date__lt=pub_date)
+                                     | Q(pub_date=pub_date, recipe_id__lt=pk))
+            recipes = recipes.filter(Q(pub_date__lt=pub_date)
+                                     | Q(pub_date=pub_date, id__lt=pk))
+        entries = entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id')[:limit]
+        recipes = recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id')[:limit]
+
+        positions = []
+        for position in heapq.merge(entries, recipes, reverse=True):
+            if positions and positions[-1] == position:
+                continue
+            positions.append(position)
+            if len(positions) == limit:
+                break
+        return positions
+
+    def recipes(self, user, queryset, limit, before=None):
+        ids = [pk for _, pk in self.recipe_positions(user, limit, before)]
+        recipes = queryset.in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+    objects = TimelineManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='Timeline entry unique constraint'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
@@ -0,0 +1,13 @@
+from .models import ShoppingCart, ShoppingListItem
+
+
+def remove_deleted_recipe(sender, instance, **kwargs):
+    ShoppingListItem.objects.change_recipe(
+        instance.id, ShoppingListItem.objects.recipe_amounts(instance.id), {})
+
+
+def rebuild_shopping_lists(sender, recipe_ids, **kwargs):
+    user_ids = set(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids).values_list('user_id', flat=True))
+    if user_ids:
+        ShoppingListItem.objects.rebuild(user_ids)
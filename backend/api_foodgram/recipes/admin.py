@@ -1,13 +1,34 @@
 from django.contrib import admin
 
-from .models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from .models import (Ingredient, Recipe, RecipeIngredient, RecipeNeighbour,
+                     RecipeTag, Tag)
+from .signals import recipes_edited
+
+
+def recipes_changed(recipe_ids):
+    recipes_edited.send(sender=Recipe, recipe_ids=list(recipe_ids))
+
+
+class RecipeRowAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recipes_changed([obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recipes_changed([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recipes_changed(recipe_ids)
 
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'color', 'slug')
 
 
-class RecipeTagAdmin(admin.ModelAdmin):
+class RecipeTagAdmin(RecipeRowAdmin):
     list_display = ('id', 'recipe', 'tag')
 
 
@@ -20,7 +41,7 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name', )
 
 
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(RecipeRowAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount')
 
 
@@ -35,12 +56,19 @@ class RecipeAdmin(admin.ModelAdmin):
                     'image',
                     'cooking_time',
                     'pub_date',
-                    'favorite_count')
+                    'favorites_count',
+                    'in_carts_count')
     inlines = [TagInLineAdmin, IngredientInLineAdmin]
     search_fields = ('name', 'author', 'tags')
 
-    def favorite_count(self, obj):
-        return obj.favorite.count()
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recipes_changed([form.instance.pk])
+
+
+class RecipeNeighbourAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipe', 'kind', 'rank', 'neighbour', 'score')
+    list_filter = ('kind', )
 
 
 admin.site.register(Tag, TagAdmin)
@@ -48,3 +76,4 @@ admin.site.register(RecipeTag, RecipeTagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
+admin.site.register(RecipeNeighbour, RecipeNeighbourAdmin)
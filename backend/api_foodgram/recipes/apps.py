@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, pre_save
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from .models import Ingredient, Tag
+        from .signals import (create_search_indexes, recipes_edited,
+                              refresh_edited_recipes, remember_name_change,
+                              update_ingredient_search_vectors,
+                              update_tag_search_vectors)
+
+        post_migrate.connect(create_search_indexes, sender=self)
+        pre_save.connect(remember_name_change, sender=Tag)
+        pre_save.connect(remember_name_change, sender=Ingredient)
+        post_save.connect(update_tag_search_vectors, sender=Tag)
+        post_save.connect(update_ingredient_search_vectors, sender=Ingredient)
+        recipes_edited.connect(refresh_edited_recipes)
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def catalogue_version_key(model):
+    return f'catalogue:{model._meta.label_lower}:version'
+
+
+def get_catalogue_version(model):
+    key = catalogue_version_key(model)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, time.time(), settings.CATALOGUE_CACHE_TIMEOUT)
+    return cache.get(key, time.time())
+
+
+def bump_catalogue_version(model):
+    cache.set(catalogue_version_key(model), time.time(),
+              settings.CATALOGUE_CACHE_TIMEOUT)
+
+
+def feed_version_key(name):
+    return f'feed:{name}:version'
+
+
+def get_feed_versions(names):
+    keys = [feed_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, settings.FEED_VERSION_TIMEOUT)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_feed_versions(names):
+    cache.set_many({feed_version_key(name): time.time() for name in names},
+                   settings.FEED_VERSION_TIMEOUT)
+
+
+def invalidate_recipe_feed(recipe_id=None, author_id=None, tag_slugs=()):
+    names = [f'tag:{slug}' for slug in tag_slugs]
+    if recipe_id is not None:
+        names.append(f'recipe:{recipe_id}')
+    if author_id is not None:
+        names += ['all', f'author:{author_id}']
+    transaction.on_commit(lambda: bump_feed_versions(names))
+
+
+def invalidate_feeds(author_ids=(), tag_slugs=(), recipe_ids=()):
+    names = ['all', *(f'author:{author_id}' for author_id in author_ids),
+             *(f'tag:{slug}' for slug in tag_slugs),
+             *(f'recipe:{recipe_id}' for recipe_id in recipe_ids)]
+    transaction.on_commit(lambda: bump_feed_versions(names))
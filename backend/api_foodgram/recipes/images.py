@@ -0,0 +1,82 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate_recipe_feed
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_PIPELINE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def process_recipe_image(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+
+    with default_storage.open(recipe.image.name) as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        has_alpha = ('A' in image.getbands()
+                     or 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    stem = PurePosixPath(recipe.image.name).stem
+    variants = {}
+    for name, size in settings.IMAGE_VARIANTS.items():
+        path = f'recipes/images/variants/{stem}_{name}.webp'
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        variants[name] = default_storage.save(
+            path, ContentFile(render_variant(image, size)))
+
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).update(image_variants=variants)
+    if updated:
+        invalidate_recipe_feed(recipe_id)
+        stale = set(recipe.image_variants.values()) - set(variants.values())
+    else:
+        stale = variants.values()
+    for path in stale:
+        default_storage.delete(path)
+
+
+def run_image_task(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(recipe_id):
+    if settings.IMAGE_PIPELINE == 'sync':
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+    else:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_image_task, recipe_id))
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import RecipeNeighbour
+from recipes.recommendations import build_neighbours
+
+KINDS = [kind for kind, _ in RecipeNeighbour.KINDS]
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты: по совместному добавлению '
+            'в избранное и корзины и по TF-IDF векторам ингредиентов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', dest='kinds',
+                            choices=KINDS)
+        parser.add_argument('--limit', type=int,
+                            default=settings.RECOMMENDATIONS_LIMIT)
+        parser.add_argument('--block-size', type=int, default=1024,
+                            help='Рецептов в одном блоке умножения матриц')
+        parser.add_argument('--max-df', type=float, default=0.2,
+                            help='Игнорировать ингредиенты, встречающиеся '
+                                 'чаще чем в этой доле рецептов')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for kind in options['kinds'] or KINDS:
+            started = time.monotonic()
+            with transaction.atomic():
+                total = build_neighbours(
+                    kind, options['limit'], options['block_size'],
+                    options['max_df'], options['batch_size'])
+            self.stdout.write(f'{kind}: {total} связей за '
+                              f'{time.monotonic() - started:.1f} с')
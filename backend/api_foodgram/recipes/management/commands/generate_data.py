@@ -0,0 +1,145 @@
+import io
+import random
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from misc.models import (Favorite, ShoppingCart, ShoppingListItem,
+                         Subscription, TimelineEntry)
+from recipes.cache import invalidate_feeds
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from recipes.pantry import reset_pantry_index
+from users.models import User
+
+PLACEHOLDER_IMAGE = 'recipes/images/synthetic.png'
+DISHES = ('Суп', 'Салат', 'Пирог', 'Рагу', 'Каша', 'Запеканка', 'Паста')
+ADJECTIVES = ('домашний', 'быстрый', 'летний', 'острый', 'сытный')
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетические данные для нагрузочного тестирования: '
+            'пользователей, рецепты, избранное, корзины и подписки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument('--password', default='synthetic-password')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int)
+
+    def bulk_insert(self, model, objects, batch_size):
+        started = time.monotonic()
+        total = 0
+        while True:
+            batch = list(islice(objects, batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {total} строк, '
+            f'{total / max(elapsed, 1e-6):.0f} строк/с'
+        )
+
+    def placeholder_image(self):
+        if not default_storage.exists(PLACEHOLDER_IMAGE):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), 'orange').save(buffer, 'PNG')
+            default_storage.save(PLACEHOLDER_IMAGE,
+                                 ContentFile(buffer.getvalue()))
+        return PLACEHOLDER_IMAGE
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        prefix = options['prefix']
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not tag_ids or not ingredient_ids:
+            raise CommandError('Сначала загрузите тэги и ингредиенты: '
+                               'python manage.py load_data')
+
+        image = self.placeholder_image()
+        password = make_password(options['password'])
+        offset = User.objects.filter(username__startswith=prefix).count()
+
+        with transaction.atomic():
+            self.bulk_insert(User, (
+                User(email=f'{prefix}{i}@example.com',
+                     username=f'{prefix}{i}',
+                     first_name='Имя', last_name=f'Фамилия {i}',
+                     password=password)
+                for i in range(offset, offset + options['users'])
+            ), batch_size)
+            user_ids = list(User.objects.filter(
+                username__startswith=prefix).values_list('id', flat=True))
+
+            # Авторы с меньшим рангом получают больше рецептов и подписчиков
+            weights = [1 / (rank + 1) for rank in range(len(user_ids))]
+            last_recipe = Recipe.objects.order_by('-id').first()
+            start_id = last_recipe.id if last_recipe else 0
+            self.bulk_insert(Recipe, (
+                Recipe(author_id=author_id,
+                       name=f'{rng.choice(DISHES)} {rng.choice(ADJECTIVES)}',
+                       text='Синтетический рецепт для нагрузочного теста',
+                       image=image,
+                       cooking_time=rng.randint(5, 180))
+                for author_id in rng.choices(user_ids, weights,
+                                             k=options['recipes'])
+            ), batch_size)
+            recipe_ids = list(Recipe.objects.filter(
+                id__gt=start_id, author_id__in=user_ids
+            ).values_list('id', flat=True))
+
+            self.bulk_insert(RecipeTag, (
+                RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in rng.sample(tag_ids,
+                                         rng.randint(1, min(3, len(tag_ids))))
+            ), batch_size)
+            self.bulk_insert(RecipeIngredient, (
+                RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient,
+                                 amount=rng.randint(1, 500))
+                for recipe_id in recipe_ids
+                for ingredient in rng.sample(ingredient_ids, rng.randint(
+                    min(3, len(ingredient_ids)), min(12, len(ingredient_ids))))
+            ), batch_size)
+            Recipe.objects.filter(id__gt=start_id).update_search_vector()
+
+            for model, per_user in ((Favorite, options['favorites']),
+                                    (ShoppingCart, options['carts'])):
+                self.bulk_insert(model, (
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id in user_ids
+                    for recipe_id in rng.sample(
+                        recipe_ids, min(per_user, len(recipe_ids)))
+                ), batch_size)
+            self.bulk_insert(Subscription, (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in set(rng.choices(
+                    user_ids, weights, k=options['subscriptions']))
+                if author_id != user_id
+            ), batch_size)
+
+            call_command('reconcile_counters', stdout=self.stdout)
+            ShoppingListItem.objects.rebuild(user_ids)
+            TimelineEntry.objects.rebuild(user_ids)
+            reset_pantry_index()
+            invalidate_feeds(user_ids,
+                             Tag.objects.values_list('slug', flat=True))
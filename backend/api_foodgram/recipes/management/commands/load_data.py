@@ -1,24 +1,76 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.cache import bump_catalogue_version
 from recipes.models import Ingredient, Tag
 
+DATA_DIR = Path(settings.BASE_DIR) / 'data'
+
+
+def read_rows(path, fields):
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        if path.suffix == '.csv':
+            rows = csv.reader(f)
+        elif path.suffix in ('.jsonl', '.ndjson'):
+            rows = (json.loads(line) for line in f if line.strip())
+        elif path.suffix == '.json':
+            rows = json.load(f)
+        else:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+
+        for number, row in enumerate(rows, 1):
+            if isinstance(row, list):
+                row = dict(zip(fields, row))
+            if not isinstance(row, dict):
+                raise CommandError(
+                    f'{path}, запись {number}: ожидается объект или список')
+            missing = [field for field in fields if field not in row]
+            if missing:
+                raise CommandError(f'{path}, запись {number}: '
+                                   f'нет полей {", ".join(missing)}')
+            yield {field: row[field] for field in fields}
+
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты и тэги из CSV, JSON или JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients',
+                            default=DATA_DIR / 'ingredients.csv')
+        parser.add_argument('--tags', default=DATA_DIR / 'tags.csv')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def load(self, model, path, fields, batch_size):
+        rows = read_rows(path, fields)
+        started = time.monotonic()
+        total = 0
+        while True:
+            batch = [model(**row) for row in islice(rows, batch_size)]
+            if not batch:
+                break
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {total} строк, '
+                f'{total / max(elapsed, 1e-6):.0f} строк/с'
+            )
+        transaction.on_commit(lambda: bump_catalogue_version(model))
+
     def handle(self, *args, **options):
-        with open('data/ingredients.csv') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name, measurement_unit=measurement_unit
-                )
-
-        with open('data/tags.csv') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                name, color, slug = row
-                Tag.objects.get_or_create(
-                    name=name, color=color, slug=slug
-                )
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            if options['ingredients']:
+                self.load(Ingredient, options['ingredients'],
+                          ('name', 'measurement_unit'), batch_size)
+            if options['tags']:
+                self.load(Tag, options['tags'],
+                          ('name', 'color', 'slug'), batch_size)
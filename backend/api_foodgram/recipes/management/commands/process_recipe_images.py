@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Генерирует уменьшенные WebP-варианты изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        recipe_ids = list(recipes.values_list('id', flat=True))
+
+        for number, recipe_id in enumerate(recipe_ids, start=1):
+            process_recipe_image(recipe_id)
+            if number % 100 == 0 or number == len(recipe_ids):
+                self.stdout.write(f'Обработано {number} из {len(recipe_ids)}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_recipe = Recipe.objects.order_by('-id').first()
+        last_id = last_recipe.id if last_recipe else 0
+        total = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                total += Recipe.objects.filter(
+                    id__gt=start, id__lte=start + batch_size
+                ).update_search_vector()
+        self.stdout.write(f'Обновлено рецептов: {total}')
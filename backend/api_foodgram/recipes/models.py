@@ -1,8 +1,16 @@
+from django.apps import apps
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, router
+from django.db.models import (Exists, F, OuterRef, Prefetch, Subquery, Value,
+                              Window)
+from django.db.models.functions import Coalesce, RowNumber
 
 from users.models import User
 
+SEARCH_CONFIG = 'russian'
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -35,6 +43,12 @@ class Ingredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='Ingredient unique constraint'
+            ),
+        ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -42,6 +56,74 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def for_feed(self, user):
+        queryset = self.defer('search_vector').prefetch_related(
+            Prefetch('recipetag_set',
+                     queryset=RecipeTag.objects.select_related('tag')),
+            Prefetch('recipeingredient_set',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+        )
+        if user.is_anonymous:
+            return queryset.select_related('author')
+
+        favorite = apps.get_model('misc', 'Favorite')
+        shopping_cart = apps.get_model('misc', 'ShoppingCart')
+        subscription = apps.get_model('misc', 'Subscription')
+        authors = User.objects.annotate(is_subscribed=Exists(
+            subscription.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors)
+        ).annotate(
+            is_favorited=Exists(favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(shopping_cart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def update_search_vector(self):
+        db = self._db or router.db_for_write(self.model)
+        if connections[db].vendor != 'postgresql':
+            return 0
+
+        def names(model, field):
+            return Coalesce(Subquery(
+                model.objects.filter(recipe=OuterRef('pk'))
+                             .values('recipe')
+                             .annotate(names=StringAgg(field, ' '))
+                             .values('names')
+            ), Value(''), output_field=models.TextField())
+
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(names(RecipeTag, 'tag__name'),
+                           weight='B', config=SEARCH_CONFIG)
+            + SearchVector(names(RecipeIngredient, 'ingredient__name'),
+                           weight='B', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+
+    def latest_by_author(self, author_ids, limit=None):
+        if not author_ids:
+            return []
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return list(queryset)
+        queryset = queryset.annotate(recipe_rank=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        ))
+        sql, params = queryset.query.sql_with_params()
+        return list(self.raw(
+            f'SELECT * FROM ({sql}) ranked '
+            f'WHERE recipe_rank <= %s ORDER BY recipe_rank',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -64,15 +146,37 @@ class Recipe(models.Model):
     image = models.ImageField(
         upload_to='recipes/images/'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True
+    )
     cooking_time = models.IntegerField(
         validators=[MinValueValidator(1)]
     )
     pub_date = models.DateTimeField(
         auto_now_add=True
     )
+    favorites_count = models.IntegerField(
+        default=0
+    )
+    in_carts_count = models.IntegerField(
+        default=0
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -92,6 +196,16 @@ class RecipeTag(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'tag'],
+                name='Recipe tag unique constraint'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'],
+                         name='recipetag_tag_recipe_idx'),
+        ]
         verbose_name = 'Тэги рецепта'
         verbose_name_plural = 'Тэги рецептов'
 
@@ -111,5 +225,51 @@ class RecipeIngredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='Recipe ingredient unique constraint'
+            ),
+        ]
         verbose_name = 'Ингредиенты рецепта'
         verbose_name_plural = 'Ингредиенты рецептов'
+
+
+class RecipeNeighbour(models.Model):
+    FAVORITES = 'favorites'
+    INGREDIENTS = 'ingredients'
+    KINDS = (
+        (FAVORITES, 'Избранное и корзины'),
+        (INGREDIENTS, 'Ингредиенты'),
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours'
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    kind = models.CharField(
+        max_length=16,
+        choices=KINDS
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'kind', 'neighbour'],
+                name='Recipe neighbour unique constraint'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['recipe', 'kind', 'rank'],
+                         name='neighbour_recipe_kind_idx'),
+        ]
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
@@ -0,0 +1,157 @@
+import time
+from itertools import chain
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import RecipeIngredient
+
+VERSION_KEY = 'pantry:version'
+
+
+def change_key(version):
+    return f'pantry:changes:{version}'
+
+
+def get_pantry_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(VERSION_KEY, version, settings.PANTRY_VERSION_TIMEOUT)
+        return cache.get(VERSION_KEY, version)
+    return version
+
+
+def record_changes(recipe_ids):
+    recipe_ids = tuple(recipe_ids)
+    get_pantry_version()
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        return
+    cache.set(change_key(version), recipe_ids,
+              settings.PANTRY_VERSION_TIMEOUT)
+
+
+def record_pantry_changes(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: record_changes(recipe_ids))
+
+
+def reset_pantry_index():
+    transaction.on_commit(lambda: cache.set(
+        VERSION_KEY, int(time.time() * 1000),
+        settings.PANTRY_VERSION_TIMEOUT))
+
+
+def recipe_ingredients(recipe_ids=None):
+    rows = RecipeIngredient.objects.filter(ingredient__isnull=False)
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    rows = rows.order_by().values_list('recipe_id', 'ingredient_id')
+    return np.fromiter(chain.from_iterable(rows.iterator(10000)),
+                       dtype=np.int64).reshape(-1, 2)
+
+
+class PantryIndex:
+    def __init__(self, version):
+        self.version = version
+        self.built = time.monotonic()
+        pairs = recipe_ingredients()
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        self.sizes = np.bincount(rows, minlength=len(self.recipe_ids))
+        order = np.argsort(pairs[:, 1], kind='stable')
+        self.ingredient_ids, starts = np.unique(pairs[order, 1],
+                                                return_index=True)
+        self.indptr = np.append(starts, len(order))
+        self.postings = rows[order]
+        # Рецепты, изменённые после построения индекса
+        self.delta = {}
+
+    def apply(self, recipe_ids):
+        changed = {recipe_id: set() for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in recipe_ingredients(recipe_ids):
+            changed[int(recipe_id)].add(int(ingredient_id))
+        # Словарь заменяется целиком: поиск в других потоках работает
+        # со своей ссылкой на прежнюю версию
+        self.delta = {**self.delta, **changed}
+
+    def base_scores(self, pantry, delta):
+        positions = np.searchsorted(self.ingredient_ids, pantry)
+        known = positions < len(self.ingredient_ids)
+        known[known] = self.ingredient_ids[positions[known]] == pantry[known]
+        postings = [self.postings[self.indptr[i]:self.indptr[i + 1]]
+                    for i in positions[known]]
+        matched = np.bincount(
+            np.concatenate(postings) if postings else np.empty(0, int),
+            minlength=len(self.recipe_ids))
+        if delta:
+            stale = np.searchsorted(self.recipe_ids, list(delta))
+            stale = stale[stale < len(self.recipe_ids)]
+            stale = stale[np.isin(self.recipe_ids[stale], list(delta))]
+            matched[stale] = 0
+        return matched
+
+    def search(self, ingredient_ids, limit, min_coverage=0):
+        delta = self.delta
+        pantry = np.unique(np.asarray(ingredient_ids, dtype=np.int64))
+        matched = self.base_scores(pantry, delta)
+        coverage = matched / np.maximum(self.sizes, 1)
+        candidates = np.flatnonzero(
+            (matched > 0) & (coverage >= min_coverage))
+        key = coverage[candidates] * 65536 + matched[candidates]
+        if len(candidates) > limit:
+            top = np.argpartition(-key, limit)[:limit]
+            candidates, key = candidates[top], key[top]
+        results = [
+            (int(self.recipe_ids[row]), int(matched[row]),
+             int(self.sizes[row]))
+            for row in candidates
+        ]
+
+        pantry = set(pantry.tolist())
+        for recipe_id, ingredients in delta.items():
+            count = len(ingredients & pantry)
+            if count and count / len(ingredients) >= min_coverage:
+                results.append((recipe_id, count, len(ingredients)))
+        results.sort(key=lambda item: (-item[1] / item[2], -item[1], item[0]))
+        return results[:limit]
+
+
+class LocalPantryIndex:
+    def __init__(self):
+        self.index = None
+        self.lock = Lock()
+
+    def expired(self):
+        ttl = settings.PANTRY_INDEX_TTL
+        return bool(ttl) and time.monotonic() - self.index.built > ttl
+
+    def catch_up(self, version):
+        # Версии начинаются с метки времени в мс: после сброса или
+        # вытеснения ключа разрыв огромный, и ключи не перебираются
+        if not 0 < version - self.index.version <= settings.PANTRY_MAX_DELTA:
+            return False
+        keys = [change_key(step)
+                for step in range(self.index.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return False
+        self.index.apply(set(chain.from_iterable(changes.values())))
+        self.index.version = version
+        return len(self.index.delta) <= settings.PANTRY_MAX_DELTA
+
+    def get(self):
+        version = get_pantry_version()
+        with self.lock:
+            if (self.index is None or self.expired()
+                    or (self.index.version != version
+                        and not self.catch_up(version))):
+                self.index = PantryIndex(version)
+            return self.index
+
+
+pantry_index = LocalPantryIndex()
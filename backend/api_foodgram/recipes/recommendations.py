@@ -0,0 +1,110 @@
+from itertools import chain
+
+import numpy as np
+from django.apps import apps
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredient, RecipeNeighbour
+
+
+def load_pairs(queryset, chunk_size=10000):
+    values = queryset.order_by().iterator(chunk_size)
+    return np.fromiter(chain.from_iterable(values),
+                       dtype=np.int64).reshape(-1, 2)
+
+
+def recipe_positions(recipe_ids, pairs):
+    positions = np.searchsorted(recipe_ids, pairs[:, 0])
+    known = positions < len(recipe_ids)
+    known[known] = recipe_ids[positions[known]] == pairs[known, 0]
+    return positions[known], pairs[known, 1]
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return (sparse.diags(1 / norms) @ matrix).tocsr()
+
+
+def interaction_matrix(recipe_ids):
+    favorite = apps.get_model('misc', 'Favorite')
+    shopping_cart = apps.get_model('misc', 'ShoppingCart')
+    pairs = np.concatenate([
+        load_pairs(model.objects.values_list('recipe_id', 'user_id'))
+        for model in (favorite, shopping_cart)
+    ])
+    rows, users = recipe_positions(recipe_ids, pairs)
+    users, columns = np.unique(users, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, columns)),
+        shape=(len(recipe_ids), len(users)),
+    )
+    return normalize_rows(matrix)
+
+
+def ingredient_matrix(recipe_ids, max_df):
+    pairs = load_pairs(RecipeIngredient.objects.filter(
+        ingredient__isnull=False).values_list('recipe_id', 'ingredient_id'))
+    rows, ingredients = recipe_positions(recipe_ids, pairs)
+    ingredients, columns = np.unique(ingredients, return_inverse=True)
+    frequency = np.bincount(columns, minlength=len(ingredients))
+    idf = np.log(len(recipe_ids) / frequency)
+    # Слишком частые ингредиенты (соль, вода) не отличают рецепты
+    idf[frequency > max_df * len(recipe_ids)] = 0
+    matrix = sparse.csr_matrix(
+        (idf[columns], (rows, columns)),
+        shape=(len(recipe_ids), len(ingredients)),
+    )
+    matrix.eliminate_zeros()
+    return normalize_rows(matrix)
+
+
+def top_neighbours(matrix, limit, block_size):
+    transposed = matrix.T.tocsr()
+    for start in range(0, matrix.shape[0], block_size):
+        block = (matrix[start:start + block_size] @ transposed).tocsr()
+        for row in range(block.shape[0]):
+            begin, end = block.indptr[row], block.indptr[row + 1]
+            columns = block.indices[begin:end]
+            scores = block.data[begin:end]
+            keep = (columns != start + row) & (scores > 0)
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > limit:
+                top = np.argpartition(-scores, limit)[:limit]
+                columns, scores = columns[top], scores[top]
+            order = np.argsort(-scores, kind='stable')
+            yield start + row, columns[order], scores[order]
+
+
+def store_neighbours(kind, recipe_ids, neighbours, batch_size):
+    RecipeNeighbour.objects.filter(kind=kind).delete()
+    total = 0
+    batch = []
+    for row, columns, scores in neighbours:
+        batch += [
+            RecipeNeighbour(recipe_id=int(recipe_ids[row]),
+                            neighbour_id=int(recipe_ids[column]),
+                            kind=kind, rank=rank, score=float(score))
+            for rank, (column, score) in enumerate(zip(columns, scores))
+        ]
+        if len(batch) >= batch_size:
+            RecipeNeighbour.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    RecipeNeighbour.objects.bulk_create(batch)
+    return total + len(batch)
+
+
+def build_neighbours(kind, limit, block_size, max_df, batch_size):
+    recipe_ids = np.fromiter(
+        Recipe.objects.order_by('id').values_list('id', flat=True).iterator(),
+        dtype=np.int64)
+    if not len(recipe_ids):
+        return store_neighbours(kind, recipe_ids, [], batch_size)
+    if kind == RecipeNeighbour.FAVORITES:
+        matrix = interaction_matrix(recipe_ids)
+    else:
+        matrix = ingredient_matrix(recipe_ids, max_df)
+    return store_neighbours(
+        kind, recipe_ids, top_neighbours(matrix, limit, block_size),
+        batch_size)
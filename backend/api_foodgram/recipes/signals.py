@@ -0,0 +1,53 @@
+from django.db import connections
+from django.dispatch import Signal
+
+from .models import Recipe
+from .pantry import record_pantry_changes
+
+# Рецепты изменены в обход API (в админке), аргумент recipe_ids
+recipes_edited = Signal()
+
+SEARCH_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+
+
+def create_search_indexes(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for statement in SEARCH_INDEXES:
+            cursor.execute(statement)
+
+
+def remember_name_change(sender, instance, update_fields=None, **kwargs):
+    # Поисковые векторы зависят только от названия, а не от цвета или
+    # единицы измерения
+    if instance.pk is None or (update_fields is not None
+                               and 'name' not in update_fields):
+        instance.name_changed = False
+        return
+    instance.name_changed = not sender.objects.filter(
+        pk=instance.pk, name=instance.name).exists()
+
+
+def update_tag_search_vectors(sender, instance, created, **kwargs):
+    if not created and instance.name_changed:
+        Recipe.objects.filter(tags=instance).update_search_vector()
+
+
+def update_ingredient_search_vectors(sender, instance, created, **kwargs):
+    if not created and instance.name_changed:
+        Recipe.objects.filter(ingredients=instance).update_search_vector()
+
+
+def refresh_edited_recipes(sender, recipe_ids, **kwargs):
+    Recipe.objects.filter(pk__in=recipe_ids).update_search_vector()
+    record_pantry_changes(recipe_ids)
@@ -21,6 +21,14 @@ class User(AbstractUser):
         'Last name',
         max_length=150,
     )
+    recipes_count = models.IntegerField(
+        'Recipes count',
+        default=0,
+    )
+    followers_count = models.IntegerField(
+        'Followers count',
+        default=0,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['id', 'username', 'first_name', 'last_name']